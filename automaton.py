@@ -0,0 +1,1222 @@
+import codecs
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+
+
+class Automaton:
+    """Compact automaton core shared by the lfa modules.
+
+    States and symbols are interned to dense ints; the original names are
+    kept once in ``states`` and ``symbols``. Transitions are stored CSR
+    style: the edges leaving state q are ``offsets[q]:offsets[q + 1]`` in
+    the parallel ``labels`` (symbol id, -1 for epsilon) and ``targets``
+    arrays, sorted by label.
+    """
+
+    __slots__ = ('states', 'symbols', 'state_ids', 'symbol_ids', 'initial', 'finals',
+                 'offsets', 'labels', 'targets')
+
+    def __init__(self, states, symbols, offsets, labels, targets, initial, finals):
+        self.states = states
+        self.symbols = symbols
+        self.state_ids = {state: i for i, state in enumerate(states)}
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(symbols)}
+        self.offsets = offsets
+        self.labels = labels
+        self.targets = targets
+        self.initial = initial
+        self.finals = finals  # bytearray, 1 for final states
+
+    @classmethod
+    def from_transitions(cls, transitions, initial_state, final_states, states=(), alphabet=()):
+        """Build the core from a ``{(state, symbol): targets}`` dict."""
+        names = [initial_state]
+        state_ids = {initial_state: 0}
+        symbols = sorted({symbol for symbol in alphabet if symbol != ''} |
+                         {symbol for (_, symbol) in transitions if symbol != ''}, key=str)
+        symbol_ids = {symbol: i for i, symbol in enumerate(symbols)}
+
+        def intern(state):
+            i = state_ids.get(state)
+            if i is None:
+                i = state_ids[state] = len(names)
+                names.append(state)
+            return i
+
+        for state in states:
+            intern(state)
+        rows = {}
+        for (state, symbol), next_states in transitions.items():
+            q = intern(state)
+            label = symbol_ids[symbol] if symbol != '' else -1
+            row = rows.setdefault(q, [])
+            for next_state in next_states:
+                row.append((label, intern(next_state)))
+        # Final states may appear in no transition, so intern them before sizing
+        final_ids = [intern(state) for state in final_states]
+        finals = bytearray(len(names))
+        for q in final_ids:
+            finals[q] = 1
+
+        offsets = array('q', [0])
+        labels = array('i')
+        targets = array('i')
+        for q in range(len(names)):
+            for label, target in sorted(set(rows.get(q, ()))):
+                labels.append(label)
+                targets.append(target)
+            offsets.append(len(labels))
+        return cls(names, symbols, offsets, labels, targets, 0, finals)
+
+    def successors(self, q, label):
+        # Targets of state q on a symbol id (-1 for epsilon)
+        start, end = self.offsets[q], self.offsets[q + 1]
+        lo = bisect_left(self.labels, label, start, end)
+        hi = bisect_right(self.labels, label, lo, end)
+        return self.targets[lo:hi]
+
+    def is_deterministic(self):
+        labels, offsets = self.labels, self.offsets
+        for q in range(len(self.states)):
+            previous = -1
+            for i in range(offsets[q], offsets[q + 1]):
+                if labels[i] <= previous:
+                    return False
+                previous = labels[i]
+        return True
+
+    def epsilon_closures(self):
+        # Epsilon closure of every single state as an int bitmask
+        closures = []
+        for q in range(len(self.states)):
+            mask = 1 << q
+            stack = [q]
+            while stack:
+                for p in self.successors(stack.pop(), -1):
+                    if not mask >> p & 1:
+                        mask |= 1 << p
+                        stack.append(p)
+            closures.append(mask)
+        return closures
+
+    def subset_construction(self):
+        """Determinize; returns the DFA core and the NFA state bitmask behind each DFA state.
+
+        Subsets are int bitmasks, the worklist is a deque, and every new
+        subset gets the next dense id. DFA states are named D0, D1, ...
+        """
+        closures = self.epsilon_closures()
+        labels, targets, offsets = self.labels, self.targets, self.offsets
+        # moves[a][q]: closed subset reached from state q on symbol a
+        moves = [[0] * len(self.states) for _ in self.symbols]
+        for q in range(len(self.states)):
+            for i in range(offsets[q], offsets[q + 1]):
+                if labels[i] >= 0:
+                    moves[labels[i]][q] |= closures[targets[i]]
+
+        final_mask = 0
+        for q, final in enumerate(self.finals):
+            if final:
+                final_mask |= 1 << q
+
+        subset_ids = {closures[self.initial]: 0}
+        subsets = [closures[self.initial]]
+        dfa_offsets = array('q', [0])
+        dfa_labels = array('i')
+        dfa_targets = array('i')
+        queue = deque([0])
+        while queue:
+            current = list(iter_bits(subsets[queue.popleft()]))
+            for a, row in enumerate(moves):
+                next_mask = 0
+                for q in current:
+                    next_mask |= row[q]
+                if next_mask:
+                    next_id = subset_ids.get(next_mask)
+                    if next_id is None:
+                        next_id = subset_ids[next_mask] = len(subsets)
+                        subsets.append(next_mask)
+                        queue.append(next_id)
+                    dfa_labels.append(a)
+                    dfa_targets.append(next_id)
+            # States leave the queue in id order, so rows are laid out in order
+            dfa_offsets.append(len(dfa_labels))
+
+        finals = bytearray(1 if mask & final_mask else 0 for mask in subsets)
+        names = [f'D{i}' for i in range(len(subsets))]
+        dfa = Automaton(names, list(self.symbols), dfa_offsets, dfa_labels, dfa_targets, 0, finals)
+        return dfa, subsets
+
+    def determinize(self):
+        if self.is_deterministic():
+            return self
+        return self.subset_construction()[0]
+
+    def transition_map(self):
+        return TransitionView(self)
+
+    def final_states(self):
+        return {self.states[q] for q, final in enumerate(self.finals) if final}
+
+
+class TransitionView(Mapping):
+    """Read-only ``{(state, symbol): targets}`` view over an Automaton.
+
+    Lets code written against the dict-of-sets transitions (to_dfa,
+    to_regular_grammar, CompiledAutomaton) run on the compact
+    core without materializing the dict.
+    """
+
+    __slots__ = ('automaton',)
+
+    def __init__(self, automaton):
+        self.automaton = automaton
+
+    def __getitem__(self, key):
+        state, symbol = key
+        automaton = self.automaton
+        q = automaton.state_ids.get(state)
+        label = -1 if symbol == '' else automaton.symbol_ids.get(symbol)
+        if q is None or label is None:
+            raise KeyError(key)
+        found = automaton.successors(q, label)
+        if not found:
+            raise KeyError(key)
+        return frozenset(automaton.states[p] for p in found)
+
+    def __iter__(self):
+        automaton = self.automaton
+        labels, offsets = automaton.labels, automaton.offsets
+        for q, state in enumerate(automaton.states):
+            previous = None
+            for i in range(offsets[q], offsets[q + 1]):
+                label = labels[i]
+                if label != previous:
+                    previous = label
+                    yield state, automaton.symbols[label] if label >= 0 else ''
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def iter_bits(mask):
+    # Positions of the set bits of mask, lowest first
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+_MAGIC = b'LFAD'
+_VERSION = 1
+_HEADER = '<4sI?IIII'
+
+
+class CompiledAutomaton:
+    """Integer-indexed form of a finite automaton's transitions dict.
+
+    States and symbols are mapped to dense ints, epsilon closures are folded
+    into the table, and matching walks the table in a flat loop. When every
+    entry has at most one target the automaton is run as a DFA over a plain
+    list of ints, with -1 standing for the dead state.
+    """
+
+    def __init__(self, transitions, start_state, accept_states):
+        states = [start_state]
+        seen = {start_state}
+        symbols = []
+        for (state, symbol), targets in transitions.items():
+            for s in (state, *targets):
+                if s not in seen:
+                    seen.add(s)
+                    states.append(s)
+            if symbol != '' and symbol not in symbols:
+                symbols.append(symbol)
+        for s in accept_states:
+            if s not in seen:
+                seen.add(s)
+                states.append(s)
+
+        self.states = states
+        self.symbols = symbols
+        self.state_ids = {s: i for i, s in enumerate(states)}
+        self.symbol_ids = {a: i for i, a in enumerate(symbols)}
+        self.start = 0
+        self.accepting = frozenset(self.state_ids[s] for s in accept_states)
+
+        # Epsilon closure of every state, computed once with an explicit stack
+        epsilon = [[] for _ in states]
+        for (state, symbol), targets in transitions.items():
+            if symbol == '':
+                epsilon[self.state_ids[state]].extend(self.state_ids[t] for t in targets)
+        closures = []
+        for q in range(len(states)):
+            closure = {q}
+            stack = [q]
+            while stack:
+                for t in epsilon[stack.pop()]:
+                    if t not in closure:
+                        closure.add(t)
+                        stack.append(t)
+            closures.append(closure)
+        self.closures = [frozenset(c) for c in closures]
+
+        # table[q * k + a] is the epsilon-closed set of states reached from q on a
+        k = len(symbols)
+        table = [frozenset()] * (len(states) * k)
+        for (state, symbol), targets in transitions.items():
+            if symbol == '':
+                continue
+            row = self.state_ids[state] * k + self.symbol_ids[symbol]
+            reached = set(table[row])
+            for t in targets:
+                reached |= self.closures[self.state_ids[t]]
+            table[row] = frozenset(reached)
+        # A state also moves on everything its epsilon closure moves on
+        for q, closure in enumerate(self.closures):
+            if len(closure) > 1:
+                for a in range(k):
+                    reached = set()
+                    for p in closure:
+                        reached |= table[p * k + a]
+                    table[q * k + a] = frozenset(reached)
+        self.table = table
+        self.start_set = self.closures[self.start]
+
+        self.is_deterministic = len(self.start_set) == 1 and all(len(t) <= 1 for t in table)
+        if self.is_deterministic:
+            self.delta = [next(iter(t)) if t else -1 for t in table]
+        else:
+            self.delta = None
+        # Run state before any input: a state id for DFAs, a set of ids otherwise
+        self.initial = self.start if self.is_deterministic else self.start_set
+        self._numpy_cache = None
+        self._count_cache = None
+
+    def is_accepting(self, state):
+        if state is None:
+            return False
+        if self.delta is not None:
+            return state in self.accepting
+        return not self.accepting.isdisjoint(state)
+
+    def run(self, state, input_string):
+        """Advance ``state`` over ``input_string``; None once the run is dead."""
+        k = len(self.symbols)
+        symbol_ids = self.symbol_ids
+        if self.delta is not None:
+            delta = self.delta
+            q = state
+            for symbol in input_string:
+                a = symbol_ids.get(symbol)
+                if a is None:
+                    return None
+                q = delta[q * k + a]
+                if q < 0:
+                    return None
+            return q
+
+        table = self.table
+        current = state
+        for symbol in input_string:
+            a = symbol_ids.get(symbol)
+            if a is None:
+                return None
+            next_states = set()
+            for q in current:
+                next_states |= table[q * k + a]
+            if not next_states:
+                return None
+            current = next_states
+        return current
+
+    def accepts(self, input_string):
+        return self.is_accepting(self.run(self.initial, input_string))
+
+    def save(self, path):
+        """Write a deterministic automaton in the binary format read by load().
+
+        Layout: a header (magic, version, byte order, state and symbol
+        counts, start state, symbol list length), the JSON symbol list, one
+        byte per state for final states, padding to 4 bytes, then the
+        states x symbols int32 transition table (-1 for the dead state).
+        The file is written next to ``path`` and renamed into place.
+        """
+        if self.delta is None:
+            raise ValueError("Only deterministic automata can be saved")
+        symbols = json.dumps(self.symbols).encode('utf-8')
+        n, k = len(self.states), len(self.symbols)
+        finals = bytearray(n)
+        for q in self.accepting:
+            finals[q] = 1
+        header = struct.pack(_HEADER, _MAGIC, _VERSION, sys.byteorder == 'little', n, k, self.start, len(symbols))
+        body = header + symbols + bytes(finals)
+        body += bytes(-len(body) % 4)
+
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(body)
+            file.write(array('i', self.delta).tobytes())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """Map a file written by save(); the transition table is used in place."""
+        with open(path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little, n, k, start, symbols_length = struct.unpack_from(_HEADER, data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a compiled automaton file")
+        offset = struct.calcsize(_HEADER)
+        symbols = json.loads(data[offset:offset + symbols_length].decode('utf-8'))
+        offset += symbols_length
+        finals = data[offset:offset + n]
+        offset += n + (-(offset + n) % 4)
+        if len(data) < offset + 4 * n * k:
+            raise ValueError(f"{path} is truncated")
+
+        delta = memoryview(data)[offset:offset + 4 * n * k].cast('i')
+        if little != (sys.byteorder == 'little'):
+            # Written on a machine with the other byte order: swap a copy
+            swapped = array('i', delta)
+            swapped.byteswap()
+            delta = swapped
+
+        self = cls.__new__(cls)
+        self.states = range(n)
+        self.symbols = symbols
+        self.state_ids = None
+        self.symbol_ids = {a: i for i, a in enumerate(symbols)}
+        self.start = start
+        self.accepting = frozenset(q for q in range(n) if finals[q])
+        self.closures = None
+        self.table = None
+        self.start_set = frozenset([start])
+        self.is_deterministic = True
+        self.delta = delta
+        self.initial = start
+        self._numpy_cache = None
+        self._count_cache = None
+        self._mapping = data  # Keeps the file mapped while the table is in use
+        return self
+
+    def accepts_many(self, strings, batch_size=65536):
+        """Return a NumPy boolean array telling which of ``strings`` are accepted.
+
+        Inputs are packed into one flat array of symbol ids and all strings
+        are advanced together, one table gather per input position, over a
+        dense DFA table. Requires a deterministic automaton.
+        """
+        import numpy as np
+
+        if self.delta is None:
+            raise ValueError("accepts_many needs a deterministic automaton")
+        flat, width, lookup, accept = self._numpy_tables()
+
+        strings = list(strings)
+        dead = len(self.states) * width
+        result = np.zeros(len(strings), dtype=bool)
+        for offset in range(0, len(strings), batch_size):
+            batch = strings[offset:offset + batch_size]
+            lengths = np.fromiter(map(len, batch), dtype=np.int64, count=len(batch))
+            codes = np.frombuffer(''.join(batch).encode('utf-32-le'), dtype=np.uint32)
+            ids = lookup[np.minimum(codes, len(lookup) - 1)]
+
+            # One row per string, longest first, so the strings still running
+            # at a given step are always a prefix of the rows. Rows that reach
+            # the dead state are dropped now and then to keep the gathers small.
+            index = np.argsort(-lengths, kind='stable')
+            negative_lengths = -lengths[index]
+            position = (np.cumsum(lengths) - lengths)[index]
+            state = np.full(len(batch), self.start * width, dtype=np.int32)
+            step = 0
+            while True:
+                active = int(np.searchsorted(negative_lengths, -step))
+                if not active:
+                    break
+                running = state[:active]
+                running[...] = flat[running + ids[position[:active] + step]]
+                step += 1
+                if step % 8 == 0:
+                    alive = state != dead
+                    if alive.sum() < 0.75 * len(state):
+                        index, negative_lengths = index[alive], negative_lengths[alive]
+                        position, state = position[alive], state[alive]
+            result[offset + index] = accept[state // width]
+        return result
+
+    def _numpy_tables(self):
+        # Dense DFA table with an extra dead row and an extra column for
+        # symbols outside the alphabet. Targets are stored premultiplied by
+        # the row width so a step is a single gather. Cached after first use.
+        if self._numpy_cache is None:
+            import numpy as np
+
+            n, k = len(self.states), len(self.symbols)
+            dead, unknown = n, k
+            width = k + 1
+            table = np.full((n + 1, width), dead, dtype=np.int32)
+            delta = np.array(self.delta, dtype=np.int32).reshape(n, k)
+            table[:n, :k] = np.where(delta < 0, dead, delta)
+            table *= width
+
+            codes = {ord(a): i for a, i in self.symbol_ids.items() if len(a) == 1}
+            lookup = np.full(max(codes, default=0) + 2, unknown, dtype=np.int32)
+            for code, i in codes.items():
+                lookup[code] = i
+
+            accept = np.zeros(n + 1, dtype=bool)
+            accept[list(self.accepting)] = True
+            self._numpy_cache = (table.ravel(), width, lookup, accept)
+        return self._numpy_cache
+
+    def count_by_length(self, max_length):
+        """Number of accepted strings of every length from 0 to ``max_length``."""
+        return [row[self.start] for row in self._count_rows(max_length)]
+
+    def count_strings(self, length, modulus=None):
+        """Number of accepted strings of exactly ``length`` symbols.
+
+        Uses repeated squaring of the state-to-state symbol count matrix, so
+        ``length`` can be in the millions. With ``modulus`` all arithmetic
+        is done modulo that number.
+        """
+        if self.delta is None:
+            raise ValueError("Counting needs a deterministic automaton")
+        n, k = len(self.states), len(self.symbols)
+        matrix = [[0] * n for _ in range(n)]
+        for q in range(n):
+            for a in range(k):
+                p = self.delta[q * k + a]
+                if p >= 0:
+                    matrix[q][p] += 1
+        vector = [1 if q in self.accepting else 0 for q in range(n)]
+
+        def reduce(value):
+            return value % modulus if modulus else value
+
+        while length:
+            if length & 1:
+                vector = [reduce(sum(x * y for x, y in zip(row, vector) if x)) for row in matrix]
+            length >>= 1
+            if length:
+                columns = list(zip(*matrix))
+                matrix = [[reduce(sum(x * y for x, y in zip(row, column) if x)) for column in columns]
+                          for row in matrix]
+        return vector[self.start]
+
+    def sample_strings(self, length, count, seed=None):
+        """Yield ``count`` accepted strings of ``length`` symbols, uniformly at random."""
+        import random
+        rng = random.Random(seed)
+        rows = self._count_rows(length)
+        if not rows[length][self.start]:
+            raise ValueError(f"The language has no string of length {length}")
+        k = len(self.symbols)
+        delta, symbols = self.delta, self.symbols
+        for _ in range(count):
+            q = self.start
+            output = []
+            for remaining in range(length, 0, -1):
+                # Pick the next symbol in proportion to the completions it leaves
+                pick = rng.randrange(rows[remaining][q])
+                below = rows[remaining - 1]
+                for a in range(k):
+                    p = delta[q * k + a]
+                    if p >= 0:
+                        pick -= below[p]
+                        if pick < 0:
+                            break
+                output.append(symbols[a])
+                q = p
+            yield ''.join(output)
+
+    def strings(self, max_length=None):
+        """Yield the accepted strings in shortlex order: by length, then by symbol.
+
+        Each string comes once, and only branches that can still reach an
+        accepting state in the remaining length are followed. Whether the
+        language is finite is decided up front, from the states that are
+        both reachable and co-reachable: it is infinite exactly when those
+        states form a cycle. A finite language stops after its longest
+        string, an infinite one after ``max_length`` symbols, if given.
+        """
+        if self.delta is None:
+            raise ValueError("Enumerating needs a deterministic automaton")
+        n, k = len(self.states), len(self.symbols)
+        delta, symbols = self.delta, self.symbols
+        live = self._live_states()
+        if not live[self.start]:
+            return
+        longest = self._longest_path(live)
+        if longest is not None and (max_length is None or longest < max_length):
+            max_length = longest
+
+        # Moves to live states only, in symbol order
+        order = sorted(range(k), key=lambda a: symbols[a])
+        moves = [[(symbols[a], delta[q * k + a]) for a in order if delta[q * k + a] >= 0 and live[delta[q * k + a]]]
+                 if live[q] else [] for q in range(n)]
+        live_states = [q for q in range(n) if live[q]]
+        # rows[m][q]: some string of m symbols is accepted from q
+        rows = [bytearray(n)]
+        for q in self.accepting:
+            rows[0][q] = live[q]
+        length = 0
+        while max_length is None or length <= max_length:
+            while len(rows) <= length:
+                previous = rows[-1]
+                row = bytearray(n)
+                for q in live_states:
+                    for _, p in moves[q]:
+                        if previous[p]:
+                            row[q] = 1
+                            break
+                rows.append(row)
+            if rows[length][self.start]:
+                # Depth-first over symbols in order, pruned to states that
+                # can still accept in the remaining length
+                output = []
+                stack = [(self.start, length, 0)]
+                while stack:
+                    q, remaining, i = stack.pop()
+                    del output[length - remaining:]
+                    if remaining == 0:
+                        yield ''.join(output)
+                        continue
+                    below = rows[remaining - 1]
+                    options = moves[q]
+                    while i < len(options):
+                        symbol, p = options[i]
+                        i += 1
+                        if below[p]:
+                            stack.append((q, remaining, i))
+                            output.append(symbol)
+                            stack.append((p, remaining - 1, 0))
+                            break
+            length += 1
+
+    def _live_states(self):
+        # bytearray marking the states reachable from the start that can
+        # also reach an accepting state; O(n * k)
+        n, k = len(self.states), len(self.symbols)
+        delta = self.delta
+        reachable = bytearray(n)
+        reachable[self.start] = 1
+        stack = [self.start]
+        predecessors = [[] for _ in range(n)]
+        while stack:
+            q = stack.pop()
+            for p in delta[q * k:(q + 1) * k]:
+                if p >= 0:
+                    predecessors[p].append(q)
+                    if not reachable[p]:
+                        reachable[p] = 1
+                        stack.append(p)
+        live = bytearray(n)
+        stack = [q for q in self.accepting if reachable[q]]
+        for q in stack:
+            live[q] = 1
+        while stack:
+            for p in predecessors[stack.pop()]:
+                if not live[p]:
+                    live[p] = 1
+                    stack.append(p)
+        return live
+
+    def _longest_path(self, live):
+        # Length of the longest accepted string, or None when the live
+        # states have a cycle and the language is infinite; topological
+        # order by Kahn's algorithm, O(n * k)
+        n, k = len(self.states), len(self.symbols)
+        delta = self.delta
+        indegree = [0] * n
+        for q in range(n):
+            if live[q]:
+                for p in delta[q * k:(q + 1) * k]:
+                    if p >= 0 and live[p]:
+                        indegree[p] += 1
+        distance = [0] * n
+        ready = [q for q in range(n) if live[q] and not indegree[q]]
+        done = 0
+        while ready:
+            q = ready.pop()
+            done += 1
+            for p in delta[q * k:(q + 1) * k]:
+                if p >= 0 and live[p]:
+                    distance[p] = max(distance[p], distance[q] + 1)
+                    indegree[p] -= 1
+                    if not indegree[p]:
+                        ready.append(p)
+        if done < sum(live):
+            return None
+        return max(distance[q] for q in self.accepting if live[q])
+
+    def _count_rows(self, length):
+        # rows[m][q] is the number of strings of length m accepted from q,
+        # extended on demand and kept for later calls
+        if self.delta is None:
+            raise ValueError("Counting needs a deterministic automaton")
+        if self._count_cache is None:
+            self._count_cache = [[1 if q in self.accepting else 0 for q in range(len(self.states))]]
+        rows = self._count_cache
+        n, k = len(self.states), len(self.symbols)
+        delta = self.delta
+        while len(rows) <= length:
+            previous = rows[-1]
+            row = [0] * n
+            for q in range(n):
+                total = 0
+                for p in delta[q * k:(q + 1) * k]:
+                    if p >= 0:
+                        total += previous[p]
+                row[q] = total
+            rows.append(row)
+        return rows
+
+
+class LazyDFA:
+    """DFA built on the fly from a non-deterministic CompiledAutomaton.
+
+    A subset state and its row of successors are only built when a match
+    first reaches them. They live in a bounded LRU cache (``max_states``
+    entries, ``max_memory`` bytes if given). When the cache thrashes, that
+    is it evicts while fewer than ``min_symbols_per_state`` symbols are
+    matched per new state, the rest of the input is run as a plain NFA
+    simulation instead.
+    """
+
+    def __init__(self, compiled, max_states=10000, max_memory=None, min_symbols_per_state=10):
+        self.compiled = compiled
+        self.max_states = max_states
+        self.max_memory = max_memory
+        self.min_symbols_per_state = min_symbols_per_state
+        self.initial = compiled.initial  # A state id when compiled is already a DFA
+        self._cache = OrderedDict()  # subset -> row of successor subsets, None until built
+        self.memory = 0
+        self.evictions = 0
+        self.fallbacks = 0
+
+    def is_accepting(self, state):
+        return self.compiled.is_accepting(state)
+
+    def _add(self, state):
+        row = [None] * len(self.compiled.symbols)
+        self._cache[state] = row
+        self.memory += sys.getsizeof(state) + sys.getsizeof(row)
+        while len(self._cache) > self.max_states or (
+                self.max_memory is not None and self.memory > self.max_memory and len(self._cache) > 1):
+            old_state, old_row = self._cache.popitem(last=False)
+            self.memory -= sys.getsizeof(old_state) + sys.getsizeof(old_row)
+            self.evictions += 1
+        return row
+
+    def run(self, state, input_string):
+        compiled = self.compiled
+        if compiled.delta is not None:
+            return compiled.run(state, input_string)
+        k = len(compiled.symbols)
+        symbol_ids = compiled.symbol_ids
+        table = compiled.table
+        cache = self._cache
+
+        # States coming back from an NFA fallback are plain sets
+        state = frozenset(state)
+        row = cache.get(state)
+        if row is None:
+            row = self._add(state)
+        evictions = self.evictions
+        built = 1
+        for i, symbol in enumerate(input_string):
+            a = symbol_ids.get(symbol)
+            if a is None:
+                return None
+            next_state = row[a]
+            if next_state is None:
+                reached = set()
+                for q in state:
+                    reached |= table[q * k + a]
+                next_state = row[a] = frozenset(reached)
+            if not next_state:
+                return None
+            state = next_state
+            row = cache.get(state)
+            if row is None:
+                row = self._add(state)
+                built += 1
+                if self.evictions != evictions and i + 1 < self.min_symbols_per_state * built:
+                    self.fallbacks += 1
+                    return compiled.run(state, input_string[i + 1:])
+            else:
+                cache.move_to_end(state)
+        return state
+
+    def accepts(self, input_string):
+        return self.is_accepting(self.run(self.initial, input_string))
+
+    string_belongs_to_language = accepts
+
+
+class PatternSet:
+    """Many automata matched together in one pass over the input.
+
+    The automata are joined into one union automaton whose subset states
+    are built on the fly, like LazyDFA, and each carries the set of
+    patterns it accepts. Once the states a workload visits are built, a
+    symbol costs one dict lookup however many patterns are loaded. When
+    more than ``max_states`` states are cached the cache is dropped and
+    rebuilt from the current state.
+
+    ``automata`` is a list of CompiledAutomaton, reported by index, or a
+    mapping from names to CompiledAutomaton, reported by name.
+    """
+
+    def __init__(self, automata, max_states=100000):
+        if isinstance(automata, Mapping):
+            keys, automata = list(automata.keys()), list(automata.values())
+        else:
+            automata = list(automata)
+            keys = list(range(len(automata)))
+        self.keys = keys
+        self.automata = automata
+        self.max_states = max_states
+        # Global state g belongs to automaton owner[g] as local state g - base[owner[g]]
+        self.base = []
+        self.owner = []
+        accepting = []
+        initial = set()
+        for i, compiled in enumerate(automata):
+            base = len(self.owner)
+            self.base.append(base)
+            self.owner.extend([i] * len(compiled.states))
+            accepting.extend(q in compiled.accepting for q in range(len(compiled.states)))
+            initial.update(base + q for q in compiled.start_set)
+        self.accepting = accepting
+        self.initial = frozenset(initial)
+        self.resets = 0
+        self._reset()
+
+    def _reset(self):
+        self._ids = {}
+        self._subsets = []
+        self._rows = []  # id -> {symbol: next id, -1 for dead}, filled in as matching goes
+        self._matches = []  # id -> frozenset of the keys accepted there
+
+    def _intern(self, subset):
+        q = self._ids.get(subset)
+        if q is None:
+            q = self._ids[subset] = len(self._subsets)
+            self._subsets.append(subset)
+            self._rows.append({})
+            keys = self.keys
+            self._matches.append(frozenset(keys[self.owner[g]] for g in subset if self.accepting[g]))
+        return q
+
+    def _step(self, q, symbol):
+        reached = set()
+        owner, base, automata = self.owner, self.base, self.automata
+        for g in self._subsets[q]:
+            i = owner[g]
+            compiled = automata[i]
+            a = compiled.symbol_ids.get(symbol)
+            if a is None:
+                continue
+            offset = base[i]
+            row = (g - offset) * len(compiled.symbols) + a
+            if compiled.delta is not None:
+                # Loaded automata only have delta
+                p = compiled.delta[row]
+                if p >= 0:
+                    reached.add(offset + p)
+            else:
+                reached.update(offset + p for p in compiled.table[row])
+        if not reached:
+            self._rows[q][symbol] = -1
+            return -1
+        if len(self._subsets) >= self.max_states:
+            self.resets += 1
+            self._reset()
+            return self._intern(frozenset(reached))
+        p = self._rows[q][symbol] = self._intern(frozenset(reached))
+        return p
+
+    def run(self, state, input_string):
+        """Advance ``state`` (a set of union states) over ``input_string``; None once dead."""
+        if state is None:
+            return None
+        q = self._intern(state)
+        rows = self._rows
+        for symbol in input_string:
+            p = rows[q].get(symbol)
+            if p is None:
+                p = self._step(q, symbol)
+                # _step may have dropped the cache
+                rows = self._rows
+            if p < 0:
+                return None
+            q = p
+        return self._subsets[q]
+
+    def matching(self, state):
+        """Keys of the automata that accept in ``state``."""
+        if state is None:
+            return frozenset()
+        return self._matches[self._intern(state)]
+
+    def is_accepting(self, state):
+        return bool(self.matching(state))
+
+    def matches(self, input_string):
+        """Keys of the automata that accept ``input_string``."""
+        return self.matching(self.run(self.initial, input_string))
+
+    def matches_many(self, strings):
+        return [self.matches(string) for string in strings]
+
+    def accepts(self, input_string):
+        # True if any of the automata accepts
+        return bool(self.matches(input_string))
+
+
+def _on_the_fly(compiled):
+    # (initial, step(state, symbol), accepting(state)) for walking the DFA of
+    # ``compiled`` without building it: states are ids for a DFA and
+    # frozensets otherwise, with None as the dead state
+    k = len(compiled.symbols)
+    symbol_ids = compiled.symbol_ids
+    accepting = compiled.accepting
+    if compiled.delta is not None:
+        delta = compiled.delta
+
+        def step(q, symbol):
+            a = symbol_ids.get(symbol)
+            if q is None or a is None:
+                return None
+            p = delta[q * k + a]
+            return None if p < 0 else p
+
+        return compiled.start, step, lambda q: q in accepting
+
+    table = compiled.table
+    moves = {}
+
+    def step(state, symbol):
+        a = symbol_ids.get(symbol)
+        if state is None or a is None:
+            return None
+        key = (state, a)
+        reached = moves.get(key)
+        if reached is None:
+            reached = set()
+            for q in state:
+                reached |= table[q * k + a]
+            reached = moves[key] = frozenset(reached)
+        return reached or None
+
+    return compiled.start_set, step, lambda state: state is not None and not accepting.isdisjoint(state)
+
+
+def _word(paths, i):
+    # Symbols on the BFS path to pair i, paths[i] being (parent, symbol)
+    symbols = []
+    while paths[i] is not None:
+        i, symbol = paths[i]
+        symbols.append(symbol)
+    return ''.join(reversed(symbols))
+
+
+def equivalent(a, b):
+    """Whether CompiledAutomaton ``a`` and ``b`` accept the same language.
+
+    Returns ``(True, None)`` or ``(False, string)`` with a string accepted
+    by exactly one of them. Uses Hopcroft and Karp's union-find algorithm
+    over pairs of states of the two DFAs, which are built on the fly, so
+    only the pairs reached before the first difference are explored.
+    """
+    symbols = sorted(set(a.symbols) | set(b.symbols), key=str)
+    start_a, step_a, final_a = _on_the_fly(a)
+    start_b, step_b, final_b = _on_the_fly(b)
+    if final_a(start_a) != final_b(start_b):
+        return False, ''
+
+    # Union-find over the states of both sides, tagged 0 and 1
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while x != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    parent[(0, start_a)] = (1, start_b)
+    pairs = [(start_a, start_b)]
+    paths = [None]
+    queue = deque([0])
+    while queue:
+        i = queue.popleft()
+        p, q = pairs[i]
+        for symbol in symbols:
+            next_p, next_q = step_a(p, symbol), step_b(q, symbol)
+            x, y = find((0, next_p)), find((1, next_q))
+            if x == y:
+                continue
+            pairs.append((next_p, next_q))
+            paths.append((i, symbol))
+            if final_a(next_p) != final_b(next_q):
+                return False, _word(paths, len(pairs) - 1)
+            parent[x] = y
+            queue.append(len(pairs) - 1)
+    return True, None
+
+
+def includes(a, b):
+    """Whether every string accepted by ``b`` is accepted by ``a``.
+
+    Returns ``(True, None)`` or ``(False, string)`` with a string accepted
+    by ``b`` but not by ``a``, searching the product of the two DFAs on the
+    fly and stopping at the first such string.
+    """
+    symbols = sorted(set(b.symbols), key=str)
+    start_a, step_a, final_a = _on_the_fly(a)
+    start_b, step_b, final_b = _on_the_fly(b)
+    if final_b(start_b) and not final_a(start_a):
+        return False, ''
+    seen = {(start_a, start_b)}
+    pairs = [(start_a, start_b)]
+    paths = [None]
+    queue = deque([0])
+    while queue:
+        i = queue.popleft()
+        p, q = pairs[i]
+        for symbol in symbols:
+            next_q = step_b(q, symbol)
+            if next_q is None:
+                continue
+            pair = (step_a(p, symbol), next_q)
+            if pair in seen:
+                continue
+            seen.add(pair)
+            pairs.append(pair)
+            paths.append((i, symbol))
+            if final_b(next_q) and not final_a(pair[0]):
+                return False, _word(paths, len(pairs) - 1)
+            queue.append(len(pairs) - 1)
+    return True, None
+
+
+class StreamMatcher:
+    """Incremental matcher that consumes input in chunks.
+
+    Chunks may be ``str``, ``bytes`` or ``memoryview``; binary chunks are
+    decoded incrementally, so a multi-byte character split across two
+    chunks is handled. Once the run reaches the dead state further input
+    is ignored.
+    """
+
+    def __init__(self, compiled, encoding='utf-8'):
+        self.compiled = compiled
+        self.encoding = encoding
+        self.reset()
+
+    def reset(self):
+        self._decoder = codecs.getincrementaldecoder(self.encoding)()
+        self._state = self.compiled.initial
+        self.consumed = 0  # Number of symbols fed so far
+
+    @property
+    def dead(self):
+        return self._state is None
+
+    def feed(self, chunk):
+        """Consume ``chunk``; returns False once no continuation can be accepted."""
+        if self._state is None:
+            return False
+        if not isinstance(chunk, str):
+            chunk = self._decoder.decode(chunk)
+        self._state = self.compiled.run(self._state, chunk)
+        self.consumed += len(chunk)
+        return self._state is not None
+
+    def feed_file(self, file, chunk_size=1 << 20):
+        """Feed a whole file through a memory map, ``chunk_size`` bytes at a time."""
+        if hasattr(file, 'fileno'):
+            fileno = file.fileno()
+        else:
+            fileno = file
+        try:
+            data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return self._state is not None
+        with data:
+            view = memoryview(data)
+            try:
+                for offset in range(0, len(view), chunk_size):
+                    if not self.feed(view[offset:offset + chunk_size]):
+                        break
+            finally:
+                view.release()
+        return self._state is not None
+
+    def accepted(self):
+        # A partial multi-byte character left in the decoder means the input
+        # is not a complete string yet
+        if self._decoder.getstate()[0]:
+            return False
+        return self.compiled.is_accepting(self._state)
+
+
+def content_hash(value):
+    """Stable hex digest of a grammar or automaton description.
+
+    Sets and dicts are sorted first, so the digest does not depend on
+    iteration order.
+    """
+    def canonical(item):
+        if isinstance(item, dict):
+            return sorted(((canonical(k), canonical(v)) for k, v in item.items()), key=repr)
+        if isinstance(item, (set, frozenset)):
+            return sorted((canonical(x) for x in item), key=repr)
+        if isinstance(item, (list, tuple)):
+            return [canonical(x) for x in item]
+        return item
+
+    return hashlib.sha256(repr(canonical(value)).encode('utf-8')).hexdigest()
+
+
+def cache_directory():
+    return os.environ.get('LFA_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'lfa')
+
+
+def load_or_compile(key, build, cache_dir=None):
+    """Load the compiled automaton cached under ``key``, or build and store it.
+
+    ``build`` is only called on a cache miss and must return a
+    deterministic CompiledAutomaton. A cache that cannot be read or
+    written is treated as a miss; the automaton built in memory is
+    returned all the same.
+    """
+    cache_dir = cache_dir or cache_directory()
+    path = os.path.join(cache_dir, f'{key}.dfa')
+    try:
+        return CompiledAutomaton.load(path)
+    except (OSError, ValueError, struct.error):
+        pass
+    compiled = build()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        compiled.save(path)
+    except OSError:
+        pass
+    return compiled
+
+
+def compile_automaton(automaton):
+    # Integer table of an lfa1 or lfa2 FiniteAutomaton (or a CompiledAutomaton as is)
+    if isinstance(automaton, CompiledAutomaton):
+        return automaton
+    if hasattr(automaton, 'compile'):
+        return automaton.compile()
+    return CompiledAutomaton(automaton.transitions, automaton.initial_state, automaton.final_states)
+
+
+class GrammarMixin:
+    """compiled_automaton() for the regular grammars of lfa1 and lfa1_2.
+
+    The class provides ``VN``, ``VT``, ``P`` and ``to_finite_automaton()``.
+    """
+
+    def compiled_automaton(self, minimize=True, cache_dir=None):
+        # Determinized (and minimized) automaton of the grammar, cached on disk
+        # by the grammar's content so later runs only map the cached file
+        key = content_hash(('grammar', 1, minimize, self.VN, self.VT, self.P))
+        return load_or_compile(key, lambda: self.to_finite_automaton().build_dfa(minimize), cache_dir)
+
+
+class FiniteAutomatonMixin:
+    """Matching, counting and comparison for the FiniteAutomaton of lfa1 and lfa1_2.
+
+    The class provides ``terminals``, ``non_terminals``, ``transitions``
+    (a dict or TransitionView), ``start_state``, ``accept_states``,
+    ``string_belongs_to_language_reference()``, and sets ``_compiled`` and
+    ``_compiled_dfa`` to None in its constructor.
+    """
+
+    def to_automaton(self):
+        # Compact shared core (int ids, CSR adjacency) for the same automaton
+        if isinstance(self.transitions, TransitionView):
+            return self.transitions.automaton
+        return Automaton.from_transitions(self.transitions, self.start_state, self.accept_states,
+                                          self.non_terminals, self.terminals)
+
+    def compile(self):
+        # Build the integer transition table once and reuse it for every match
+        if self._compiled is None:
+            self._compiled = CompiledAutomaton(self.transitions, self.start_state, self.accept_states)
+        return self._compiled
+
+    def compile_dfa(self):
+        # Same as compile(), but determinized through lfa2 when needed
+        if self._compiled_dfa is None:
+            compiled = self.compile()
+            if not compiled.is_deterministic:
+                compiled = self.build_dfa(minimize=False)
+            self._compiled_dfa = compiled
+        return self._compiled_dfa
+
+    def build_dfa(self, minimize=True):
+        from lfa2 import FiniteAutomaton as NFA
+        states = set(self.non_terminals) | {self.start_state} | set(self.accept_states)
+        nfa = NFA(states, self.terminals, self.transitions, self.start_state, self.accept_states)
+        dfa = nfa.minimize() if minimize else nfa.to_dfa()
+        return CompiledAutomaton(dfa.transitions, dfa.initial_state, dfa.final_states)
+
+    def cached_dfa(self, minimize=True, cache_dir=None):
+        # Like build_dfa(), but stored on disk under the automaton's content hash
+        key = content_hash(('automaton', 1, minimize, self.terminals, dict(self.transitions),
+                            self.start_state, self.accept_states))
+        return load_or_compile(key, lambda: self.build_dfa(minimize), cache_dir)
+
+    def accepts_many(self, strings):
+        return self.compile_dfa().accepts_many(strings)
+
+    def count_strings(self, length, modulus=None):
+        return self.compile_dfa().count_strings(length, modulus)
+
+    def count_by_length(self, max_length):
+        return self.compile_dfa().count_by_length(max_length)
+
+    def sample_strings(self, length, count, seed=None):
+        # Uniform over the accepted strings of exactly this length
+        return self.compile_dfa().sample_strings(length, count, seed)
+
+    def lazy_dfa(self, max_states=10000, max_memory=None):
+        # Builds DFA states only as matching reaches them, in a bounded cache
+        return LazyDFA(self.compile(), max_states, max_memory)
+
+    def matcher(self, encoding='utf-8'):
+        # Stateful matcher for input that arrives in chunks (feed/accepted/reset)
+        return StreamMatcher(self.compile(), encoding)
+
+    def equivalent(self, other):
+        # (True, None), or (False, a string exactly one of the two accepts);
+        # other is an lfa1/lfa2 FiniteAutomaton or a CompiledAutomaton
+        return equivalent(self.compile(), compile_automaton(other))
+
+    def includes(self, other):
+        # (True, None), or (False, a string other accepts and self does not)
+        return includes(self.compile(), compile_automaton(other))
+
+    def string_belongs_to_language(self, input_string, reference=False):
+        if reference:
+            return self.string_belongs_to_language_reference(input_string)
+        return self.compile().accepts(input_string)
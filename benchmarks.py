@@ -0,0 +1,433 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from automaton import Automaton, CompiledAutomaton
+from lfa2 import FiniteAutomaton
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def keyword_nfa(count, length, alphabet='abcdef', seed=1):
+    # Union of random keywords, one epsilon branch per keyword
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(alphabet, k=length)) for _ in range(count)]
+    states = {'start'}
+    transitions = {}
+    final_states = set()
+    for w, word in enumerate(words):
+        previous = f'w{w}_0'
+        states.add(previous)
+        transitions.setdefault(('start', ''), set()).add(previous)
+        for i, symbol in enumerate(word):
+            state = f'w{w}_{i + 1}'
+            states.add(state)
+            transitions.setdefault((previous, symbol), set()).add(state)
+            previous = state
+        final_states.add(previous)
+    return FiniteAutomaton(states, set(alphabet), transitions, 'start', final_states), words
+
+
+def bench_minimize():
+    nfa, words = keyword_nfa(3000, 10)
+    rng = random.Random(2)
+    inputs = [rng.choice(words) if rng.random() < 0.5 else ''.join(rng.choices('abcdef', k=10))
+              for _ in range(200000)]
+
+    dfa, dfa_time = timed(nfa.to_dfa)
+    minimal, minimize_time = timed(dfa.minimize)
+    print(f"NFA states:     {len(nfa.states)}")
+    print(f"DFA states:     {len(dfa.states)} ({dfa_time:.2f}s)")
+    print(f"Minimal states: {len(minimal.states)} ({minimize_time:.2f}s)")
+
+    for name, automaton in (('DFA', dfa), ('minimal DFA', minimal)):
+        compiled = CompiledAutomaton(automaton.transitions, automaton.initial_state, automaton.final_states)
+        accepted, match_time = timed(lambda: sum(map(compiled.accepts, inputs)))
+        print(f"Match {name}: {len(inputs) / match_time:,.0f} strings/s ({accepted} accepted)")
+
+
+def measured(function):
+    # Result of function() and the memory still held by it
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_core_memory():
+    rng = random.Random(3)
+    states, alphabet = 100000, 'abcdefghij'
+
+    def build_dict():
+        transitions = {}
+        for q in range(states):
+            for symbol in alphabet:
+                transitions[(f'q{q}', symbol)] = {f'q{rng.randrange(states)}'}
+        return transitions
+
+    transitions, dict_size = measured(build_dict)
+    core, core_size = measured(lambda: Automaton.from_transitions(transitions, 'q0', {'q1'}))
+    edges = len(core.targets)
+    print(f"Transitions: {edges}")
+    print(f"dict of sets: {dict_size / 2**20:.1f} MiB ({dict_size / edges:.0f} bytes/transition)")
+    print(f"Automaton:    {core_size / 2**20:.1f} MiB ({core_size / edges:.0f} bytes/transition)")
+    print(f"Reduction:    {dict_size / core_size:.1f}x")
+    names = {f'q{q}' for q in range(states)}
+    _, dict_time = timed(FiniteAutomaton(names, set(alphabet), transitions, 'q0', {'q1'}).is_deterministic)
+    _, core_time = timed(core.is_deterministic)
+    print(f"is_deterministic: dict {dict_time:.2f}s, core {core_time:.2f}s")
+
+
+def bench_lexer():
+    import re
+
+    import lfa3
+    from dfa_lexer import DFALexer, build_lexer_table
+
+    text = 'def foo(x)\n  extern bar(y)\n  {\n  return x + y * 2.0;\n  }\n' * 20000
+    identifier = [name for name, _ in lfa3.tokens].index('IDENTIFIER')
+    for extra in (0, 100, 300):
+        # Half extra keywords, half extra punctuation tokens
+        more = [(f'KW{i}', f'kw{i}x') for i in range(extra // 2)]
+        more += [(f'OP{i}', '@' + '!' * (i + 1) + '@') for i in range(extra - extra // 2)]
+        tokens = lfa3.tokens[:identifier] + more + lfa3.tokens[identifier:]
+
+        pattern = re.compile('|'.join('(?P<%s>%s)' % pair for pair in tokens))
+        count, re_time = timed(lambda: sum(1 for _ in pattern.finditer(text)))
+        lexer, build_time = timed(lambda: DFALexer(build_lexer_table(tokens)))
+        dfa_count, dfa_time = timed(lambda: sum(1 for _ in lexer.tokenize(text)))
+        print(f"{len(tokens)} token types: re {count / re_time:,.0f} tokens/s, "
+              f"DFA {dfa_count / dfa_time:,.0f} tokens/s (table built in {build_time:.2f}s)")
+
+
+def bench_token_stream():
+    import lfa6
+
+    text = 'def foo(x, y)\n  extern bar(y)\n  return x + y * 2.0 - 17;\n' * 50000
+    tokens, list_size = measured(lambda: list(lfa6.lexer(text)))
+    stream, stream_size = measured(lambda: lfa6.token_stream(text))
+    count = len(tokens)
+    print(f"Tokens: {count}")
+    print(f"list of tuples: {list_size / count:.1f} bytes/token")
+    print(f"TokenStream:    {stream_size / count:.1f} bytes/token ({stream.nbytes / count:.1f} in the arrays)")
+    _, parse_time = timed(lfa6.parse, stream)
+    print(f"parse(TokenStream): {count / parse_time:,.0f} tokens/s")
+
+
+def random_expression(rng, names, depth):
+    if depth == 0 or rng.random() < 0.15:
+        return rng.choice(names) if rng.random() < 0.5 else str(rng.randint(1, 99))
+    expression = f"{random_expression(rng, names, depth - 1)} {rng.choice('+-*/')} {random_expression(rng, names, depth - 1)}"
+    return f"({expression})" if rng.random() < 0.3 else expression
+
+
+def random_program(functions, depth=6, seed=4):
+    # Source text with one def per line, each returning a random expression
+    rng = random.Random(seed)
+    lines = []
+    for f in range(functions):
+        names = ['x', 'y', 'z'][:rng.randint(1, 3)]
+        lines.append(f"def f{f}({' '.join(names)}) return {random_expression(rng, names, depth)};")
+    return '\n'.join(lines) + '\n'
+
+
+def bench_parser():
+    import lfa6
+
+    text = random_program(50000)
+    stream, lex_time = timed(lfa6.token_stream, text)
+    ast, parse_time = timed(lfa6.parse, stream)
+    nodes = sum(1 for function in ast for _ in lfa6.walk(function))
+    print(f"Tokens: {len(stream)}, nodes: {nodes}")
+    print(f"Lex:   {len(stream) / lex_time:,.0f} tokens/s")
+    print(f"Parse: {nodes / parse_time:,.0f} nodes/s")
+    deep, deep_time = timed(lambda: lfa6.parse(lfa6.token_stream('(' * 100000 + '1' + ')' * 100000)))
+    print(f"100000 nested parentheses parsed in {deep_time:.2f}s")
+
+
+def bench_incremental():
+    import lfa6
+
+    text = random_program(50000)
+    _, full_time = timed(lambda: lfa6.parse(lfa6.token_stream(text)))
+    session, build_time = timed(lfa6.ParseSession, text)
+    print(f"Full lex + parse: {full_time:.2f}s (session built in {build_time:.2f}s)")
+    rng = random.Random(5)
+    times = []
+    for _ in range(200):
+        # Change one digit or operator somewhere in the file
+        position = rng.randrange(len(session.text))
+        while session.text[position] not in '0123456789+-*/':
+            position += 1
+        replacement = rng.choice('123456789') if session.text[position].isdigit() else rng.choice('+-*/')
+        _, edit_time = timed(session.edit, position, position + 1, replacement)
+        times.append(edit_time)
+    times.sort()
+    print(f"Single-character edit: median {times[100] * 1000:.1f} ms, max {times[-1] * 1000:.1f} ms")
+
+
+def bench_compile():
+    import lfa6
+
+    ast = lfa6.parse(lfa6.token_stream(random_program(200)))
+    rng = random.Random(6)
+    calls = [(function, [rng.uniform(1, 10) for _ in function.args]) for function in ast]
+    functions, compile_time = timed(lfa6.compile_program, ast)
+    interpreted = [lfa6.interpret(function) for function in ast]
+    compiled = [functions[function.name] for function in ast]
+    print(f"Compiled {len(ast)} defs in {compile_time:.2f}s")
+
+    def run(callables, repeat):
+        for _ in range(repeat):
+            for call, (_, args) in zip(callables, calls):
+                try:
+                    call(*args)
+                except ZeroDivisionError:
+                    pass
+
+    _, interpret_time = timed(run, interpreted, 20)
+    _, compiled_time = timed(run, compiled, 20)
+    count = 20 * len(calls)
+    print(f"Tree walking: {count / interpret_time:,.0f} calls/s")
+    print(f"Compiled:     {count / compiled_time:,.0f} calls/s ({interpret_time / compiled_time:.0f}x)")
+
+
+def bench_arena():
+    import lfa6
+
+    stream = lfa6.token_stream(random_program(50000))
+    ast, object_size = measured(lambda: lfa6.parse(stream))
+    arena, arena_size = measured(lambda: lfa6.parse_arena(stream))
+    print(f"Nodes: {len(arena)} (including list cells)")
+    print(f"Object nodes: {object_size / 2**20:.1f} MiB")
+    # Against the slotted node classes; the 10x target assumed __dict__ nodes
+    print(f"ArenaAST:     {arena_size / 2**20:.1f} MiB ({object_size / arena_size:.1f}x smaller)")
+
+    _, object_time = timed(lambda: sum(1 for root in ast for _ in lfa6.walk(root)))
+    _, arena_time = timed(lambda: sum(1 for root in arena.roots for _ in arena.walk(root)))
+    _, scan_time = timed(lambda: arena.kinds.count(lfa6.BINOP))
+    print(f"Walk: objects {object_time:.2f}s, arena {arena_time:.2f}s, "
+          f"arena kind scan {scan_time * 1000:.1f} ms")
+
+
+def random_grammar(productions, seed=8):
+    # Grammar text over nonterminals N0..Nk with a few ε and unit productions
+    from lfa5 import Grammar
+
+    rng = random.Random(seed)
+    count = max(productions // 4, 1)
+    rules = {f'N{i}': [] for i in range(count)}
+    for _ in range(productions):
+        A = f'N{rng.randrange(count)}'
+        roll = rng.random()
+        if roll < 0.02:
+            rules[A].append('')
+        elif roll < 0.04:
+            rules[A].append(f'N{rng.randrange(count)}')
+        else:
+            symbols = [f'N{rng.randrange(count)}' if rng.random() < 0.5 else rng.choice('abcd')
+                       for _ in range(rng.randint(1, 5))]
+            rules[A].append(' '.join(symbols))
+    grammar = Grammar()
+    for A, rhs in rules.items():
+        grammar.add_production(f"{A} -> {' | '.join(rhs or ['a'])}")
+    return grammar
+
+
+def bench_cnf():
+    for size in (2500, 5000, 10000, 20000):
+        grammar = random_grammar(size)
+        _, cnf_time = timed(grammar.convert_to_cnf)
+        result = sum(len(productions) for productions in grammar.P.values())
+        print(f"{size} productions: CNF in {cnf_time:.2f}s ({result} productions, {len(grammar.VN)} nonterminals)")
+
+
+def layered_grammar(levels, operators='+-*/%^&<>=!~'):
+    # Expression grammar with one nonterminal per precedence level:
+    # Ei -> Ei o E(i+1) | E(i+1), and the last level is ( E0 ) | a | b.
+    # '|' cannot be an operator: add_production splits alternatives on it
+    from lfa5 import Grammar
+
+    grammar = Grammar()
+    for i in range(levels):
+        grammar.add_production(f"E{i} -> E{i} {operators[i % len(operators)]} E{i + 1} | E{i + 1}")
+    grammar.add_production(f"E{levels} -> ( E0 ) | a | b")
+    return grammar
+
+
+def random_sentence(rng, levels, length, operators='+-*/%^&<>=!~'):
+    # A sentence of layered_grammar(levels) with about length symbols
+    if length <= 1:
+        return rng.choice('ab')
+    if length <= 4 or rng.random() < 0.1:
+        return '(' + random_sentence(rng, levels, length - 2, operators) + ')'
+    split = rng.randint(1, length - 2)
+    return (random_sentence(rng, levels, split, operators) + rng.choice(operators[:levels])
+            + random_sentence(rng, levels, length - split - 1, operators))
+
+
+def bench_cyk():
+    grammar = layered_grammar(200)
+    recognizer, build_time = timed(grammar.recognizer)
+    cnf_size = len(recognizer.by_left)
+    rng = random.Random(10)
+    strings = []
+    for _ in range(20000):
+        sentence = random_sentence(rng, 200, 200)
+        if rng.random() < 0.5:
+            position = rng.randrange(len(sentence))
+            sentence = sentence[:position] + rng.choice('ab()+') + sentence[position + 1:]
+        strings.append(sentence)
+    print(f"CNF recognizer built in {build_time:.2f}s ({cnf_size} nonterminals on binary left sides)")
+    results, cyk_time = timed(recognizer.accepts_many, strings)
+    print(f"{len(strings)} strings of length ~200 in {cyk_time:.1f}s: {len(strings) / cyk_time:,.0f} strings/s "
+          f"({sum(results)} accepted)")
+
+
+def bench_analysis():
+    from lfa5 import Grammar
+
+    # Rules over N0..N1999 in the order they are written; a lone multi-letter
+    # nonterminal on a right-hand side would be read as letters until it is
+    # defined, so single-symbol right-hand sides are terminals or ε
+    rng = random.Random(12)
+    lines = []
+    for i in range(2000):
+        alternatives = []
+        for _ in range(rng.randint(1, 6)):
+            length = rng.choice([0, 1, 2, 3, 4, 5]) if rng.random() < 0.1 else rng.randint(2, 5)
+            symbols = [f'N{rng.randrange(2000)}' if rng.random() < 0.5 else rng.choice('abcd')
+                       for _ in range(length)]
+            alternatives.append(rng.choice('abcd') if length == 1 else ' '.join(symbols))
+        lines.append(f"N{i} -> {' | '.join(alternatives)}")
+
+    def build():
+        grammar = Grammar()
+        analysis = grammar.analysis()
+        for line in lines:
+            grammar.add_production(line)
+            lhs = line.split('->')[0].strip()
+            analysis.nullable_symbols(), analysis.productive_symbols(), analysis.reachable_symbols()
+            analysis.first(lhs), analysis.follow(lhs), analysis.chomsky_type()
+        return analysis
+
+    analysis, incremental_time = timed(build)
+    analysis.invalidate()
+    _, rebuild_time = timed(analysis.fresh)
+    print(f"{len(lines)} rules added one at a time, all properties queried after each:")
+    print(f"Incremental: {incremental_time / len(lines) * 1000:.2f} ms per edit on average "
+          f"({len(analysis.rules)} nonterminals, {len(analysis.nullable)} nullable)")
+    print(f"Recomputing the final grammar from scratch: {rebuild_time * 1000:.0f} ms")
+
+
+def bench_pattern_set():
+    from automaton import PatternSet
+
+    # 200 keyword-with-wildcard patterns over the same alphabet, each a
+    # minimal DFA; matched one by one and then as one pattern set
+    rng = random.Random(13)
+    automata = []
+    for p in range(200):
+        nfa, _ = keyword_nfa(20, 6, seed=100 + p)
+        dfa = nfa.minimize()
+        automata.append(CompiledAutomaton(dfa.transitions, dfa.initial_state, dfa.final_states))
+    inputs = [''.join(rng.choices('abcdef', k=6)) for _ in range(20000)]
+    patterns = PatternSet(automata)
+    patterns.matches_many(inputs[:1000])
+
+    def one_by_one():
+        return [{i for i, compiled in enumerate(automata) if compiled.accepts(string)} for string in inputs]
+
+    expected, separate_time = timed(one_by_one)
+    results, set_time = timed(patterns.matches_many, inputs)
+    single, single_time = timed(automata[0].accepts_many, inputs)
+    assert [set(r) for r in results] == expected
+    print(f"{len(automata)} automata one by one: {separate_time:.2f}s; "
+          f"pattern set: {set_time:.3f}s ({len(patterns._subsets)} states built); "
+          f"one automaton: {single_time:.3f}s")
+
+
+def bench_equivalence():
+    # A 78k-state keyword NFA against its minimal DFA, then against the DFA
+    # of the same keywords with the last letter of one of them changed
+    nfa, words = keyword_nfa(6000, 12)
+    dfa = nfa.minimize()
+    changed, _ = keyword_nfa(6000, 12)
+    word = words[3000]
+    changed.transitions.pop(('w3000_11', word[11]))
+    changed.transitions[('w3000_11', 'a' if word[11] != 'a' else 'b')] = {'w3000_12'}
+    changed_dfa = changed.minimize()
+    print(f"NFA: {len(nfa.states)} states, DFAs: {len(dfa.states)} and {len(changed_dfa.states)} states")
+
+    result, equal_time = timed(nfa.equivalent, dfa)
+    print(f"NFA vs its DFA: {result} in {equal_time:.2f}s")
+    result, differ_time = timed(dfa.equivalent, changed_dfa)
+    print(f"DFA vs changed DFA: {result} in {differ_time:.3f}s")
+    result, include_time = timed(dfa.includes, changed_dfa)
+    print(f"DFA includes changed DFA: {result} in {include_time:.3f}s")
+    _, minimize_time = timed(changed.minimize)
+    print(f"(determinizing and minimizing one side: {minimize_time:.2f}s)")
+
+
+def bench_dot():
+    import os
+    import tempfile
+    from array import array
+
+    # Random 100k-state DFA over 10 symbols, 3 targets per state so that
+    # parallel edges get merged
+    rng = random.Random(14)
+    states, alphabet = 100000, 'abcdefghij'
+    offsets, labels, targets = array('q', [0]), array('i'), array('i')
+    for q in range(states):
+        choices = [rng.randrange(states) for _ in range(3)]
+        for a in range(len(alphabet)):
+            labels.append(a)
+            targets.append(rng.choice(choices))
+        offsets.append(len(labels))
+    finals = bytearray(1 if rng.random() < 0.1 else 0 for _ in range(states))
+    core = Automaton([f'q{q}' for q in range(states)], list(alphabet), offsets, labels, targets, 0, finals)
+    fa = FiniteAutomaton.from_automaton(core)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'dfa.dot')
+        for options in ({}, {'labels': os.path.join(directory, 'labels.tsv')},
+                        {'max_states': 1000, 'cluster': True}):
+            _, dot_time = timed(lambda: fa.write_dot(path, **options))
+            print(f"write_dot({', '.join(options) or 'all states'}): {dot_time:.2f}s, "
+                  f"{os.path.getsize(path) / 2**20:.1f} MiB written")
+        # Tracing slows the export down a lot, so the peak is taken separately
+        tracemalloc.start()
+        fa.write_dot(path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"Peak memory allocated while writing: {peak / 2**20:.2f} MiB")
+
+
+benchmarks = {
+    'minimize': bench_minimize,
+    'core_memory': bench_core_memory,
+    'lexer': bench_lexer,
+    'token_stream': bench_token_stream,
+    'parser': bench_parser,
+    'incremental': bench_incremental,
+    'compile': bench_compile,
+    'arena': bench_arena,
+    'cnf': bench_cnf,
+    'cyk': bench_cyk,
+    'analysis': bench_analysis,
+    'pattern_set': bench_pattern_set,
+    'equivalence': bench_equivalence,
+    'dot': bench_dot,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or benchmarks:
+        print(f"== {name}")
+        benchmarks[name]()
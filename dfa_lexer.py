@@ -0,0 +1,543 @@
+import json
+import mmap
+import os
+from array import array
+from collections import namedtuple
+from functools import partial
+
+from automaton import cache_directory, content_hash, iter_bits
+from regex_nfa import NFABuilder, leaves, parse_pattern
+
+_lexers = {}  # Lexers already built in this process, by token table hash
+
+# A token from tokenize_stream: byte offsets into the input, 1-based line and
+# byte column of the first byte
+Token = namedtuple('Token', ['type', 'value', 'start', 'end', 'line', 'column'])
+
+
+def utf8_length(lead):
+    # Bytes in the UTF-8 sequence starting with lead (1 for stray bytes)
+    if lead >= 0xF0:
+        return 4
+    if lead >= 0xE0:
+        return 3
+    if lead >= 0xC0:
+        return 2
+    return 1
+
+
+def compile_lexer(tokens, cache_dir=None):
+    """Return a DFALexer for a ``[(name, pattern), ...]`` token table.
+
+    The generated table is kept in memory and in the cache directory as
+    JSON, keyed by the content of the token table. A cache directory that
+    cannot be written only costs the rebuild in the next process.
+    """
+    key = content_hash(('lexer', 1, [tuple(token) for token in tokens]))
+    lexer = _lexers.get(key)
+    if lexer is None:
+        path = os.path.join(cache_dir or cache_directory(), f'{key}.lexer.json')
+        try:
+            with open(path) as file:
+                table = json.load(file)
+        except (OSError, ValueError):
+            table = build_lexer_table(tokens)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temporary = f'{path}.{os.getpid()}.tmp'
+                with open(temporary, 'w') as file:
+                    json.dump(table, file)
+                os.replace(temporary, path)
+            except OSError:
+                pass
+        lexer = _lexers[key] = DFALexer(table)
+    return lexer
+
+
+def literal_of(node):
+    # The fixed string a pattern matches, or None if it is not a plain literal
+    items = node[1] if node[0] == 'concat' else [node]
+    if not items or any(item[0] != 'set' or item[2] or len(item[1]) != 1 for item in items):
+        return None
+    return ''.join(next(iter(item[1])) for item in items)
+
+
+def build_lexer_table(tokens):
+    """Compile a token table into a single minimized DFA.
+
+    Earlier tokens win ties between matches of the same length. Literal
+    tokens that a higher-numbered token also matches in full (keywords such
+    as ``def`` next to IDENTIFIER) are left out of the DFA and resolved by
+    a dictionary lookup on the matched text instead.
+    """
+    names = [name for name, _ in tokens]
+    patterns = [parse_pattern(pattern) for _, pattern in tokens]
+    literals = {i: literal_of(node) for i, node in enumerate(patterns)}
+    literals = {i: literal for i, literal in literals.items() if literal}
+
+    table = _build_table(names, patterns, [i for i in range(len(tokens)) if i not in literals])
+    lexer = DFALexer(table)
+    keywords = {}
+    keyword_tokens = set()
+    for i, literal in literals.items():
+        owner = lexer.match(literal, 0)
+        if owner is not None and owner[0] > i and owner[1] == len(literal):
+            keywords.setdefault(names[owner[0]], {})[literal] = names[i]
+            keyword_tokens.add(i)
+    if len(keyword_tokens) != len(literals):
+        table = _build_table(names, patterns, [i for i in range(len(tokens)) if i not in keyword_tokens])
+    table['keywords'] = keywords
+    return table
+
+
+def _build_table(names, patterns, included):
+    from lfa2 import FiniteAutomaton
+
+    # Split the characters into classes that every pattern treats alike;
+    # characters no pattern names explicitly share the 'other' class
+    all_leaves = list({leaf for i in included for leaf in leaves(patterns[i])})
+    explicit = {chr(c) for c in range(128)}
+    for _, chars, _ in all_leaves:
+        explicit |= chars
+    signatures = {}
+    char_class = {}
+    for char in sorted(explicit):
+        signature = tuple((char in chars) != negated for _, chars, negated in all_leaves)
+        char_class[char] = signatures.setdefault(signature, len(signatures))
+    other = signatures.setdefault(tuple(negated for _, _, negated in all_leaves), len(signatures))
+    width = len(signatures)
+    leaf_classes = {}
+    for position, leaf in enumerate(all_leaves):
+        leaf_classes[leaf] = [cls for signature, cls in signatures.items() if signature[position]]
+
+    builder = NFABuilder(leaf_classes.__getitem__)
+    start = builder.new_state()
+    final_token = {}
+    for i in included:
+        fragment_start, fragment_end = builder.build(patterns[i])
+        builder.add(start, '', fragment_start)
+        final_token[fragment_end] = i
+
+    # Subset construction on the integer core, so each DFA state's NFA
+    # states come straight from its bitmask
+    nfa = FiniteAutomaton(set(range(builder.count)), set(range(width)), builder.transitions,
+                          start, set(final_token)).to_automaton()
+    dfa, subsets = nfa.subset_construction()
+    token_of = {}
+    for d, mask in enumerate(subsets):
+        if dfa.finals[d]:
+            token_of[dfa.states[d]] = min(final_token[nfa.states[q]] for q in iter_bits(mask)
+                                          if nfa.states[q] in final_token)
+    minimal = FiniteAutomaton.from_automaton(dfa).minimize(token_of)
+
+    # Lay the minimal DFA out by the ids of its compiled form, whose start is 0
+    compiled = minimal.compile()
+    count, k = len(compiled.states), len(compiled.symbols)
+    delta = [-1] * (count * width)
+    for q in range(count):
+        for a, cls in enumerate(compiled.symbols):
+            delta[q * width + cls] = compiled.delta[q * k + a]
+    accept = [-1] * count
+    for state, token in (minimal.final_classes or {}).items():
+        accept[compiled.state_ids[state]] = token
+    return {
+        'names': names,
+        'ascii': [char_class[chr(c)] for c in range(128)],
+        'extra': {char: cls for char, cls in char_class.items() if ord(char) >= 128},
+        'other': other,
+        'width': width,
+        'delta': delta,
+        'accept': accept,
+        'keywords': {},
+    }
+
+
+class DFALexer:
+    """Maximal-munch lexer over a table from build_lexer_table()."""
+
+    def __init__(self, table):
+        self.names = table['names']
+        self.ascii = table['ascii']
+        self.extra = table['extra']
+        self.other = table['other']
+        self.width = table['width']
+        self.delta = table['delta']
+        self.accept = table['accept']
+        self.keywords = table['keywords']
+
+    def _scan(self, text, pos=0, eof=True, unmatched=False, resume=None):
+        # Maximal munch over text, a str or UTF-8 bytes-like, from pos on:
+        # yields (token index, start, end), and (-1, start, end) for each
+        # character no token matches when unmatched is set. Without eof it
+        # stops before a token (or character) that may continue past the
+        # data, so the caller can resume there once it has more. If resume
+        # is a list, the scan of that token is saved in it as (bytes
+        # scanned, state, best token, its end), relative to the token's
+        # start, and picked up again when the list is passed back.
+        ascii_classes, extra, other = self.ascii, self.extra, self.other
+        delta, accept, width = self.delta, self.accept, self.width
+        binary = not isinstance(text, str)
+        length = len(text)
+        step = 1  # Characters of a str are one step; bytes set it per character
+        while pos < length:
+            if resume:
+                scanned, state, token, end = resume
+                i, end = pos + scanned, pos + end
+                resume.clear()
+            else:
+                state = 0
+                token = -1
+                end = pos
+                i = pos
+            while i < length:
+                if binary:
+                    code = text[i]
+                    if code < 128:
+                        cls = ascii_classes[code]
+                        step = 1
+                    else:
+                        step = utf8_length(code)
+                        if i + step > length and not eof:
+                            if resume is not None:
+                                resume[:] = (i - pos, state, token, end - pos)
+                            return
+                        cls = extra.get(bytes(text[i:i + step]).decode('utf-8', 'replace')[0], other)
+                else:
+                    char = text[i]
+                    code = ord(char)
+                    cls = ascii_classes[code] if code < 128 else extra.get(char, other)
+                state = delta[state * width + cls]
+                if state < 0:
+                    break
+                i += step
+                if accept[state] >= 0:
+                    token = accept[state]
+                    end = i
+            else:
+                if not eof:
+                    if resume is not None:
+                        resume[:] = (i - pos, state, token, end - pos)
+                    return
+            if token < 0:
+                step = utf8_length(text[pos]) if binary else 1
+                if unmatched:
+                    yield -1, pos, min(pos + step, length)
+                pos += step
+                continue
+            yield token, pos, end
+            pos = end
+
+    def _name(self, token, value):
+        # Token type, with keywords told apart from the token they match
+        name = self.names[token]
+        if name in self.keywords:
+            name = self.keywords[name].get(value, name)
+        return name
+
+    def match(self, text, pos):
+        """Longest token starting at ``pos`` as (token index, end), or None."""
+        token, start, end = next(self._scan(text, pos, unmatched=True), (-1, pos, pos))
+        return None if token < 0 else (token, end)
+
+    def tokenize(self, text):
+        """Yield (type, text) pairs; characters no token matches are skipped."""
+        # The hot path: _scan's loop, inlined for str only
+        ascii_classes, extra, other = self.ascii, self.extra, self.other
+        delta, accept, width = self.delta, self.accept, self.width
+        names, keywords = self.names, self.keywords
+        pos = 0
+        length = len(text)
+        while pos < length:
+            state = 0
+            token = -1
+            end = pos
+            i = pos
+            while i < length:
+                char = text[i]
+                code = ord(char)
+                state = delta[state * width + (ascii_classes[code] if code < 128 else extra.get(char, other))]
+                if state < 0:
+                    break
+                i += 1
+                if accept[state] >= 0:
+                    token = accept[state]
+                    end = i
+            if token < 0:
+                pos += 1
+                continue
+            name = names[token]
+            value = text[pos:end]
+            if name in keywords:
+                name = keywords[name].get(value, name)
+            yield name, value
+            pos = end
+
+    def spans(self, text, pos=0):
+        """Yield (type, start, end) for the tokens of ``text`` from ``pos`` on."""
+        for token, start, end in self._scan(text, pos):
+            yield self._name(token, text[start:end]), start, end
+
+    def token_stream(self, text, converters=None):
+        """Lex ``text`` into a TokenStream; characters no token matches are skipped.
+
+        ``converters`` maps token names to functions applied to their text
+        when a value is asked for, such as ``{'NUMBER': float}``.
+        """
+        names = list(self.names)
+        for table in self.keywords.values():
+            names += [name for name in table.values() if name not in names]
+        type_ids = {name: i for i, name in enumerate(names)}
+        keywords = {self.names.index(name): {literal: type_ids[keyword] for literal, keyword in table.items()}
+                    for name, table in self.keywords.items()}
+        length = len(text)
+        types = array('B' if len(names) < 256 else 'H')
+        starts = array('i' if length < 2**31 else 'q')
+        ends = array(starts.typecode)
+        for token, start, end in self._scan(text):
+            if token in keywords:
+                types.append(keywords[token].get(text[start:end], token))
+            else:
+                types.append(token)
+            starts.append(start)
+            ends.append(end)
+        return TokenStream(text, names, types, starts, ends, converters)
+
+    def tokenize_stream(self, source, chunk_size=1 << 16, skip=' \t\r\n', offset=0, line=1, line_start=0):
+        """Yield Tokens from UTF-8 bytes without decoding the whole input.
+
+        ``source`` is a binary file object, read ``chunk_size`` bytes at a
+        time, or a bytes-like object such as an ``mmap``, which is lexed in
+        place. Tokens may span chunk boundaries: the scan of an unfinished
+        token carries over to the next chunk instead of starting again.
+        Characters in ``skip`` are passed over; runs of other characters
+        no token matches come out as ERROR tokens, and a run that reaches
+        ``chunk_size`` bytes is flushed at the end of the chunk, so a long
+        run comes out in pieces instead of being held whole. ``offset``,
+        ``line`` and ``line_start`` give the position of ``source`` inside
+        a larger input.
+        """
+        skip_bytes = set(skip.encode('ascii'))
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            chunks = iter((source,))
+        else:
+            chunks = iter(partial(source.read, chunk_size), b'')
+
+        buffer = b''
+        base = offset  # Stream offset of buffer[0]
+        pos = 0
+        eof = False
+        resume = []  # Scan of the unfinished token at pos, if any
+        error = None  # Buffer position where the pending ERROR run starts
+        error_line = error_column = 0
+
+        while True:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                # Keep the unfinished token (or error run) and append the
+                # chunk; deleting from the front of a bytearray does not
+                # move the rest
+                cut = pos if error is None else error
+                if cut == len(buffer):
+                    buffer = chunk
+                elif isinstance(buffer, bytearray):
+                    del buffer[:cut]
+                    buffer += chunk
+                else:
+                    buffer = bytearray(buffer[cut:]) + chunk
+                base += cut
+                pos -= cut
+                if error is not None:
+                    error -= cut
+
+            # Stops early when the data runs out inside a possible token
+            for token, pos, end in self._scan(buffer, pos, eof, unmatched=True, resume=resume):
+                if token >= 0 or buffer[pos] in skip_bytes:
+                    if error is not None:
+                        value = bytes(buffer[error:pos]).decode('utf-8', 'replace')
+                        yield Token('ERROR', value, base + error, base + pos, error_line, error_column)
+                        error = None
+                if token < 0:
+                    byte = buffer[pos]
+                    if byte not in skip_bytes and error is None:
+                        error = pos
+                        error_line, error_column = line, base + pos - line_start + 1
+                    pos = end
+                    if byte == 10:
+                        line += 1
+                        line_start = base + pos
+                    continue
+
+                value = bytes(buffer[pos:end]).decode('utf-8', 'replace')
+                yield Token(self._name(token, value), value, base + pos, base + end, line, base + pos - line_start + 1)
+                newlines = value.count('\n')
+                if newlines:
+                    line += newlines
+                    line_start = base + pos + len(value[:value.rindex('\n') + 1].encode('utf-8'))
+                pos = end
+
+            if error is not None and (eof or pos - error >= chunk_size):
+                value = bytes(buffer[error:pos]).decode('utf-8', 'replace')
+                yield Token('ERROR', value, base + error, base + pos, error_line, error_column)
+                error = None
+            if eof:
+                return
+
+    def split_bytes(self, skip=' \t\r\n'):
+        """ASCII bytes after which the input can be cut without changing the tokens.
+
+        That is bytes no token can continue past: skipped bytes that no token
+        contains, and single-byte tokens that nothing can extend.
+        """
+        delta, width = self.delta, self.width
+        states = len(self.accept)
+        safe = set()
+        for byte in range(128):
+            cls = self.ascii[byte]
+            if any(delta[q * width + cls] >= 0 for q in range(1, states)):
+                continue
+            target = delta[cls]
+            if target < 0:
+                if chr(byte) in skip:
+                    safe.add(byte)
+            elif all(p < 0 for p in delta[target * width:(target + 1) * width]):
+                safe.add(byte)
+        return safe
+
+
+class TokenStream:
+    """Tokens of a text kept as parallel arrays of type ids and offsets.
+
+    Values are sliced out of the text (and converted) only when asked for,
+    so a token costs a few bytes instead of a tuple and a string. Iterating
+    yields the same ``(type, value)`` pairs as the generator lexers.
+    """
+
+    def __init__(self, text, names, types, starts, ends, converters=None):
+        self.text = text
+        self.names = names
+        self.types = types
+        self.starts = starts
+        self.ends = ends
+        converters = converters or {}
+        self.converters = [converters.get(name) for name in names]
+
+    def __len__(self):
+        return len(self.types)
+
+    def type(self, i):
+        return self.names[self.types[i]]
+
+    def text_of(self, i):
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def value(self, i):
+        value = self.text[self.starts[i]:self.ends[i]]
+        convert = self.converters[self.types[i]]
+        return value if convert is None else convert(value)
+
+    def __getitem__(self, i):
+        return self.type(i), self.value(i)
+
+    def __iter__(self):
+        text, names, converters = self.text, self.names, self.converters
+        for token, start, end in zip(self.types, self.starts, self.ends):
+            convert = converters[token]
+            value = text[start:end]
+            yield names[token], value if convert is None else convert(value)
+
+    @property
+    def nbytes(self):
+        # Memory held by the token arrays (not the text)
+        return sum(column.itemsize * len(column) for column in (self.types, self.starts, self.ends))
+
+
+def _lex_piece(tokens, path, start, end):
+    # Worker: map the file and lex one piece of it as if it began a file at
+    # offset start. Tokens go back as columns (type ids, values, offset
+    # arrays), which pickle far faster than a list of Token tuples, together
+    # with the piece's newline count and last newline so that the caller can
+    # shift lines and first-line columns.
+    lexer = compile_lexer(tokens)
+    with open(path, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    type_ids = {}
+    types, values = array('H'), []
+    starts, ends, lines, columns = array('q'), array('q'), array('q'), array('q')
+    with data:
+        view = memoryview(data)
+        try:
+            for token in lexer.tokenize_stream(view[start:end], offset=start, line=1, line_start=start):
+                types.append(type_ids.setdefault(token.type, len(type_ids)))
+                values.append(token.value)
+                starts.append(token.start)
+                ends.append(token.end)
+                lines.append(token.line)
+                columns.append(token.column)
+            newlines = sum(view[i:min(i + (1 << 20), end)].tobytes().count(b'\n')
+                           for i in range(start, end, 1 << 20))
+        finally:
+            view.release()
+        last_newline = data.rfind(b'\n', start, end)
+    return list(type_ids), types, values, starts, ends, lines, columns, newlines, last_newline
+
+
+def tokenize_parallel(tokens, path, workers=None, pieces=None, window=1 << 20):
+    """Lex a file in a process pool; yields the same Tokens as tokenize_stream.
+
+    The file is memory-mapped by every worker. It is cut into ``pieces``
+    ranges (default four per worker) just after bytes from split_bytes(),
+    so no token crosses a cut; each cut is the first such byte within
+    ``window`` bytes of its nominal offset, and is left out if there is
+    none. Workers count lines within their piece, and the results are
+    merged in order with lines and columns shifted to whole-file
+    positions.
+
+    The parent still builds every Token, one at a time, and that bounds
+    the speedup: on the lfa3 token table rebuilding them takes about a
+    third of a serial pass, so no number of workers gets past ~3x. With
+    one worker the file is lexed serially in this process, since the
+    pool would only add that merge and the pickling on top.
+    """
+    import re
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    pieces = pieces or 4 * workers
+    lexer = compile_lexer(tokens)
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            return
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if workers == 1:
+        with data:
+            yield from lexer.tokenize_stream(data)
+        return
+    safe = sorted(lexer.split_bytes())
+    cuts = [0]
+    with data:
+        if safe:
+            cut_byte = re.compile(b'[' + b''.join(re.escape(bytes([byte])) for byte in safe) + b']')
+            for k in range(1, pieces):
+                target = max(size * k // pieces, cuts[-1])
+                found = cut_byte.search(data, target, min(target + window, size))
+                if found:
+                    cuts.append(found.end())
+    cuts.append(size)
+    cuts = sorted(set(cuts))
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_lex_piece, tokens, path, start, end) for start, end in zip(cuts, cuts[1:])]
+        # Lines before the current piece and start of the line it begins in
+        line_offset, line_start = 0, 0
+        for future in futures:
+            names, types, values, starts, ends, lines, columns, newlines, last_newline = future.result()
+            for token, value, start, end, line, column in zip(types, values, starts, ends, lines, columns):
+                if line == 1:
+                    column = start - line_start + 1
+                yield Token(names[token], value, start, end, line + line_offset, column)
+            line_offset += newlines
+            if last_newline >= 0:
+                line_start = last_newline + 1
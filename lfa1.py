@@ -1,4 +1,6 @@
-class Grammar:
+from automaton import FiniteAutomatonMixin, GrammarMixin, PatternSet, TransitionView, compile_automaton
+
+class Grammar(GrammarMixin):
     def __init__(self):
         self.VN = {'S', 'A', 'B', 'C'}
         self.VT = {'a', 'b'}
@@ -32,6 +34,136 @@ class Grammar:
 
         return current_symbol
 
+    def derivable_lengths(self, limit, open_ended=False):
+        """Lengths of the terminal strings each non-terminal derives, as bitmasks.
+
+        Bit n is set when a string of n symbols can be derived, for n up to
+        ``limit``. Longer strings are dropped, or counted at bit ``limit``
+        when ``open_ended`` (bit ``limit`` then means "at least limit").
+        Non-terminals that derive nothing get 0.
+        """
+        full = (1 << limit + 1) - 1
+
+        def add(a, b):
+            # Lengths x + y for x in a and y in b
+            if a.bit_count() > b.bit_count():
+                a, b = b, a
+            result = 0
+            while a:
+                low = a & -a
+                result |= b << low.bit_length() - 1
+                a ^= low
+            if open_ended and result >> limit + 1:
+                result |= 1 << limit
+            return result & full
+
+        terminal = add(2, 1)
+        lengths = {variable: 0 for variable in self.VN}
+        changed = True
+        while changed:
+            changed = False
+            for variable, productions in self.P.items():
+                for production in productions:
+                    mask = 1
+                    for symbol in production:
+                        mask = add(mask, lengths[symbol] if symbol in self.VN else terminal)
+                    if mask & ~lengths[variable]:
+                        lengths[variable] |= mask
+                        changed = True
+        return lengths, add
+
+    def generate_strings(self, count, seed=None, min_length=0, max_length=None):
+        """Yield ``count`` random strings of the grammar, reproducible through ``seed``.
+
+        With ``max_length`` each string first gets a length, drawn uniformly
+        from those the grammar derives between ``min_length`` and
+        ``max_length``; without it, the length only has to reach
+        ``min_length``. Every symbol is then expanded with a length budget:
+        a production is chosen among those that can derive it, and the
+        budget is split over the production's symbols with precomputed
+        length masks, so each choice costs O(#productions) and every string
+        is built in one pass, without retries.
+        """
+        import random
+        rng = random.Random(seed)
+        open_ended = max_length is None
+        limit = min_length if open_ended else max_length
+        lengths, add = self.derivable_lengths(limit, open_ended)
+        targets = lengths['S'] >> min_length << min_length
+        if not targets:
+            raise ValueError(f"The grammar has no string of {min_length} to {max_length} symbols")
+        non_terminals = self.VN
+        terminal = add(2, 1)
+        width = limit + 1
+
+        def reverse(mask):
+            # Bit x of the result is bit limit - x of mask
+            return int(format(mask, f'0{width}b')[::-1], 2)
+
+        # Productions that derive something, with the lengths each suffix of
+        # them derives: after[j] for production[j:], also bit-reversed
+        options = {}
+        for variable, productions in self.P.items():
+            for production in productions:
+                after = [1]
+                for symbol in reversed(production):
+                    after.append(add(after[-1], lengths[symbol] if symbol in non_terminals else terminal))
+                after.reverse()
+                if after[0]:
+                    options.setdefault(variable, []).append((production, after, [reverse(m) for m in after]))
+
+        def pick(mask):
+            # A uniformly random set bit of mask
+            if not mask & mask - 1:
+                return mask.bit_length() - 1
+            low = (mask & -mask).bit_length() - 1
+            high = mask.bit_length() - 1
+            for _ in range(16):
+                x = rng.randint(low, high)
+                if mask >> x & 1:
+                    return x
+            bits = format(mask, 'b')[::-1]
+            return rng.choice([x for x in range(low, high + 1) if bits[x] == '1'])
+
+        choice = rng.choice
+        for _ in range(count):
+            output = []
+            # (symbol, budget, exact): derive exactly budget symbols, or at
+            # least budget symbols when not exact; bit limit of an open-ended
+            # mask already means "at least limit"
+            if open_ended:
+                stack = [('S', min_length, False)]
+            else:
+                stack = [('S', pick(targets), True)]
+            while stack:
+                symbol, budget, exact = stack.pop()
+                if symbol not in non_terminals:
+                    output.append(symbol)
+                    continue
+                if exact and not budget:
+                    continue  # It derives ε; expanding could go on and on
+                if exact:
+                    production, after, reversed_after = choice(
+                        [option for option in options[symbol] if option[1][0] >> budget & 1])
+                else:
+                    production, after, reversed_after = choice(
+                        [option for option in options[symbol] if option[1][0] >> budget])
+                parts = []
+                for j, next_symbol in enumerate(production):
+                    own = lengths[next_symbol] if next_symbol in non_terminals else terminal
+                    if exact:
+                        # x with the rest of the production deriving budget - x
+                        size = pick(own & reversed_after[j + 1] >> limit - budget & (2 << budget) - 1)
+                        budget -= size
+                    else:
+                        # x with the rest reaching budget - x; the longest
+                        # the rest derives is its highest bit
+                        shortest = max(budget - after[j + 1].bit_length() + 1, 0)
+                        size = pick(own >> shortest << shortest)
+                        budget = max(budget - size, 0)
+                    parts.append((next_symbol, size, exact or size < limit))
+                stack.extend(reversed(parts))
+            yield ''.join(output)
 
     def to_finite_automaton(self):
         terminals = self.VT
@@ -74,36 +206,38 @@ class Grammar:
 
         return FiniteAutomaton(terminals, non_terminals, transitions, start_state, accept_states)
 
-class FiniteAutomaton:
+class FiniteAutomaton(FiniteAutomatonMixin):
     def __init__(self, terminals, non_terminals, transitions, start_state, accept_states):
         self.terminals = terminals  # Set of terminal symbols
         self.non_terminals = non_terminals  # Set of non-terminal symbols
-        self.transitions = {}  # Dictionary representing transitions: {(state, symbol): next_state}
-        for key, value in transitions.items():
-            self.transitions[tuple(key)] = value
+        if isinstance(transitions, TransitionView):
+            self.transitions = transitions  # Read straight from a compact Automaton core
+        else:
+            self.transitions = {}  # Dictionary representing transitions: {(state, symbol): next_state}
+            for key, value in transitions.items():
+                self.transitions[tuple(key)] = value
         self.start_state = start_state  # Initial state
         self.accept_states = accept_states  # Set of accept states
+        self._compiled = None  # Integer transition table, built on first match
+        self._compiled_dfa = None  # Determinized table for batch matching and counting
 
-    def string_belongs_to_language(self, input_string):
-        current_states = {self.start_state}
-        # Helper function to get next states for a given state and symbol
-        def get_next_states(state, symbol, visited):
+    def string_belongs_to_language_reference(self, input_string):
+        # Helper function to collect the states reachable through epsilon moves
+        def epsilon_closure(state, visited):
             visited.add(state)
-            next_states = set()
-            for s in self.transitions.get((state, symbol), []):
-                if s not in visited:
-                    next_states.add(s)
-                    next_states |= get_next_states(s, symbol, visited)
             for s in self.transitions.get((state, ''), []):
                 if s not in visited:
-                    next_states |= get_next_states(s, symbol, visited)
-            return next_states
+                    epsilon_closure(s, visited)
+            return visited
+
+        current_states = epsilon_closure(self.start_state, set())
 
         # Iterate over each symbol in the input string
         for symbol in input_string:
             next_states = set()
             for state in current_states:
-                next_states |= get_next_states(state, symbol, set())
+                for s in self.transitions.get((state, symbol), []):
+                    epsilon_closure(s, next_states)
             current_states = next_states
 
         # Check if any of the current states are accept states
@@ -112,6 +246,16 @@ class FiniteAutomaton:
                 return True
         return False
 
+def pattern_set(automata, max_states=100000):
+    """Match many automata in one pass; ``matches(s)`` is the set of those accepting s.
+
+    ``automata`` is a list, reported by index, or a dict, reported by key,
+    of lfa1 or lfa2 FiniteAutomaton or CompiledAutomaton instances.
+    """
+    if isinstance(automata, dict):
+        return PatternSet({key: compile_automaton(a) for key, a in automata.items()}, max_states)
+    return PatternSet([compile_automaton(a) for a in automata], max_states)
+
 class Main:
     def __init__(self):
         self.grammar = Grammar()
@@ -140,9 +284,13 @@ class Main:
         for _ in range(5):
             generated_string = self.grammar.generate_string()
             print(f'{generated_string}')
-        fa = self.grammar.to_finite_automaton()
+        fa = self.finite_automaton
         print(fa.string_belongs_to_language("abaabb"))
         print(fa.string_belongs_to_language("a"))
+        # The grammar's automaton is deterministic, so the lazy DFA runs its table as is
+        lazy = fa.lazy_dfa()
+        for string in ("abaabb", "a", ""):
+            assert lazy.string_belongs_to_language(string) == fa.string_belongs_to_language(string)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,6 @@
-class Grammar:
+from automaton import FiniteAutomatonMixin, GrammarMixin, TransitionView
+
+class Grammar(GrammarMixin):
     def __init__(self):
         self.VN = {'S', 'A', 'B', 'C'}
         self.VT = {'a', 'b'}
@@ -28,9 +30,10 @@ class Grammar:
         return current_symbol
 
     def classify_grammar(self):
-        if all(len(p) == 2 for p_list in self.P.values() for p in p_list):
+        lengths = {len(p) for p_list in self.P.values() for p in p_list}
+        if lengths <= {2}:
             return "Type 2: Context-Free Grammar"
-        elif all(len(p) <= 2 for p_list in self.P.values() for p in p_list):
+        elif max(lengths) <= 2:
             return "Type 3: Regular Grammar"
         else:
             return "Other types of grammar (Not Type 3 or Type 2)"
@@ -67,34 +70,37 @@ class Grammar:
 
         return FiniteAutomaton(terminals, non_terminals, transitions, start_state, accept_states)
 
-class FiniteAutomaton:
+class FiniteAutomaton(FiniteAutomatonMixin):
     def __init__(self, terminals, non_terminals, transitions, start_state, accept_states):
         self.terminals = terminals 
         self.non_terminals = non_terminals  
-        self.transitions = {} 
-        for key, value in transitions.items():
-            self.transitions[tuple(key)] = value
+        if isinstance(transitions, TransitionView):
+            self.transitions = transitions
+        else:
+            self.transitions = {} 
+            for key, value in transitions.items():
+                self.transitions[tuple(key)] = value
         self.start_state = start_state  
         self.accept_states = accept_states  
+        self._compiled = None
+        self._compiled_dfa = None
 
-    def string_belongs_to_language(self, input_string):
-        current_states = {self.start_state}
-        def get_next_states(state, symbol, visited):
+    def string_belongs_to_language_reference(self, input_string):
+        # Helper function to collect the states reachable through epsilon moves
+        def epsilon_closure(state, visited):
             visited.add(state)
-            next_states = set()
-            for s in self.transitions.get((state, symbol), []):
-                if s not in visited:
-                    next_states.add(s)
-                    next_states |= get_next_states(s, symbol, visited)
             for s in self.transitions.get((state, ''), []):
                 if s not in visited:
-                    next_states |= get_next_states(s, symbol, visited)
-            return next_states
+                    epsilon_closure(s, visited)
+            return visited
+
+        current_states = epsilon_closure(self.start_state, set())
 
         for symbol in input_string:
             next_states = set()
             for state in current_states:
-                next_states |= get_next_states(state, symbol, set())
+                for s in self.transitions.get((state, symbol), []):
+                    epsilon_closure(s, next_states)
             current_states = next_states
 
         for state in current_states:
@@ -130,7 +136,7 @@ class Main:
         for _ in range(5):
             generated_string = self.grammar.generate_string()
             print(f'{generated_string}')
-        fa = self.grammar.to_finite_automaton()
+        fa = self.finite_automaton
         print(fa.string_belongs_to_language("abaabb"))
         print(fa.string_belongs_to_language("a"))
         print("Grammar Classification:", self.grammar.classify_grammar())
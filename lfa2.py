@@ -1,4 +1,7 @@
-import graphviz
+from array import array
+from collections import deque
+
+from automaton import Automaton, CompiledAutomaton, TransitionView, equivalent, includes, iter_bits
 
 class FiniteAutomaton:
     def __init__(self, states, alphabet, transitions, initial_state, final_states):
@@ -7,8 +10,27 @@ class FiniteAutomaton:
         self.transitions = transitions
         self.initial_state = initial_state
         self.final_states = final_states
+        self._compiled = None  # Integer transition table, built on first use
+        self.final_classes = None  # Class of each final state, set by minimize(final_classes)
+
+    @classmethod
+    def from_automaton(cls, automaton):
+        # Wrap a compact Automaton core; transitions are read through a view
+        return cls(automaton.states, set(automaton.symbols), automaton.transition_map(),
+                   automaton.states[automaton.initial], automaton.final_states())
+
+    def to_automaton(self):
+        if isinstance(self.transitions, TransitionView):
+            return self.transitions.automaton
+        return Automaton.from_transitions(self.transitions, self.initial_state, self.final_states,
+                                          self.states, self.alphabet)
 
     def is_deterministic(self):
+        if isinstance(self.transitions, TransitionView):
+            return self.transitions.automaton.is_deterministic()
+        for (state, symbol), next_states in self.transitions.items():
+            if symbol == '' and next_states:
+                return False
         for state in self.states:
             for symbol in self.alphabet:
                 if len(self.transitions.get((state, symbol), [])) > 1:
@@ -23,9 +45,9 @@ class FiniteAutomaton:
         grammar = {}
         for state in dfa.states:
             for symbol in dfa.alphabet:
-                next_state = dfa.transitions.get((state, symbol), '')
-                if next_state:
-                    grammar.setdefault(state, []).append(symbol + next_state)
+                for next_state in dfa.transitions.get((state, symbol), []):
+                    next_state_label = ', '.join(next_state) if isinstance(next_state, tuple) else next_state
+                    grammar.setdefault(state, []).append(symbol + next_state_label)
 
         return grammar
 
@@ -33,72 +55,272 @@ class FiniteAutomaton:
         if self.is_deterministic():
             return self
 
-        dfa_states = set()
-        dfa_transitions = {}
-        dfa_final_states = set()
+        nfa = self.to_automaton()
+        dfa_core, subsets = nfa.subset_construction()
+        dfa = FiniteAutomaton.from_automaton(dfa_core)
+        # The NFA states behind every DFA state, for reporting
+        dfa.subsets = {
+            name: tuple(sorted((nfa.states[q] for q in iter_bits(mask)), key=str))
+            for name, mask in zip(dfa_core.states, subsets)
+        }
+        return dfa
 
-        def epsilon_closure(states):
-            closure = set(states)
-            for state in states:
-                for next_state in self.transitions.get((state, ''), []):
-                    if next_state not in closure:
-                        closure.add(next_state)
-                        closure.update(epsilon_closure([next_state]))
-            return closure
+    def minimize(self, final_classes=None):
+        """Return the minimal DFA of this automaton (Hopcroft's algorithm).
 
-        initial_state_closure = epsilon_closure([self.initial_state])
-        dfa_states.add(tuple(sorted(initial_state_closure)))
-        queue = [initial_state_closure]
+        Missing transitions go to an implicit dead state, which is dropped
+        again from the result together with every state equivalent to it.
+        ``final_classes`` optionally maps the final states of the DFA to a
+        class (such as the token they accept) so that only final states of
+        the same class are merged; the result then carries the same mapping
+        for its own states as ``final_classes``.
+        """
+        dfa = self.to_dfa()
+        symbols = sorted((symbol for symbol in dfa.alphabet if symbol != ''), key=str)
 
-        while queue:
-            current_states = queue.pop(0)
-            current_states_tuple = tuple(sorted(current_states))
+        # Number the reachable states; index n is the implicit dead state
+        states = [dfa.initial_state]
+        index = {dfa.initial_state: 0}
+        delta = []
+        for state in states:
+            row = []
+            for symbol in symbols:
+                next_state = next(iter(dfa.transitions.get((state, symbol), ())), None)
+                if next_state is None:
+                    row.append(-1)
+                    continue
+                if next_state not in index:
+                    index[next_state] = len(states)
+                    states.append(next_state)
+                row.append(index[next_state])
+            delta.append(row)
+        n = len(states)
+        delta = [[n if p < 0 else p for p in row] for row in delta]
+        delta.append([n] * len(symbols))
 
-            for symbol in self.alphabet:
-                next_states = set()
-                for state in current_states:
-                    next_states.update(self.transitions.get((state, symbol), []))
-                next_states_closure = epsilon_closure(next_states)
-                next_states_closure_tuple = tuple(sorted(next_states_closure))
+        # inverse[a][p]: states that move to p on symbols[a]
+        inverse = [[[] for _ in range(n + 1)] for _ in symbols]
+        for q, row in enumerate(delta):
+            for a, p in enumerate(row):
+                inverse[a][p].append(q)
 
-                if next_states_closure_tuple:
-                    if next_states_closure_tuple not in dfa_states:
-                        dfa_states.add(next_states_closure_tuple)
-                        queue.append(next_states_closure)
-                    dfa_transitions[(current_states_tuple, symbol)] = next_states_closure_tuple
+        final = {index[state] for state in dfa.final_states if state in index}
+        groups = {}
+        for q in final:
+            groups.setdefault(final_classes[states[q]] if final_classes else None, set()).add(q)
+        blocks = [block for block in (*groups.values(), set(range(n + 1)) - final) if block]
+        block_of = [0] * (n + 1)
+        for b, block in enumerate(blocks):
+            for q in block:
+                block_of[q] = b
+        largest = max(range(len(blocks)), key=lambda b: len(blocks[b]))
+        waiting = {(b, a) for b in range(len(blocks)) if b != largest for a in range(len(symbols))}
 
-        for state in dfa_states:
-            if any(final_state in state for final_state in self.final_states):
-                dfa_final_states.add(state)
+        while waiting:
+            splitter, a = waiting.pop()
+            # Group the predecessors of the splitter block by their own block
+            touched = {}
+            for p in blocks[splitter]:
+                for q in inverse[a][p]:
+                    touched.setdefault(block_of[q], []).append(q)
+            for b, moved in touched.items():
+                if len(moved) == len(blocks[b]):
+                    continue
+                new = len(blocks)
+                blocks.append(set(moved))
+                blocks[b].difference_update(moved)
+                for q in moved:
+                    block_of[q] = new
+                for c in range(len(symbols)):
+                    if (b, c) in waiting:
+                        waiting.add((new, c))
+                    else:
+                        waiting.add((new if len(blocks[new]) <= len(blocks[b]) else b, c))
 
-        return FiniteAutomaton(dfa_states, self.alphabet, dfa_transitions, initial_state_closure, dfa_final_states)
+        # Name the surviving blocks in breadth-first order from the initial one
+        dead = block_of[n]
+        names = {}
+        transitions = {}
+        order = deque([block_of[0]])
+        names[block_of[0]] = 'D0'
+        while order:
+            b = order.popleft()
+            q = next(iter(blocks[b]))
+            for symbol, p in zip(symbols, delta[q]):
+                target = block_of[p]
+                if target == dead:
+                    continue
+                if target not in names:
+                    names[target] = f'D{len(names)}'
+                    order.append(target)
+                transitions[(names[b], symbol)] = {names[target]}
 
-    def draw_graph(self):
-        dot = graphviz.Digraph()
+        final_states = {names[b] for b in names if next(iter(blocks[b])) in final}
+        minimal = FiniteAutomaton(set(names.values()), dfa.alphabet, transitions, 'D0', final_states)
+        if final_classes:
+            minimal.final_classes = {
+                names[b]: final_classes[states[next(iter(blocks[b]))]]
+                for b in names if next(iter(blocks[b])) in final
+            }
+        return minimal
 
-        for state in self.states:
-            state_label = ', '.join(state) if isinstance(state, tuple) else state
-            if state in self.final_states:
-                dot.node(state_label, shape='doublecircle')
-            else:
-                dot.node(state_label)
-
-        for transition, next_states in self.transitions.items():
-            current_states, symbol = transition
-            current_states_label = ', '.join(current_states) if isinstance(current_states, tuple) else current_states
-            for next_state in next_states:
-                next_state_label = ', '.join(next_state) if isinstance(next_state, tuple) else next_state
-                dot.edge(current_states_label, next_state_label, label=symbol)
+    def compile(self):
+        if self._compiled is None:
+            self._compiled = CompiledAutomaton(self.transitions, self.initial_state, self.final_states)
+        return self._compiled
+
+    def equivalent(self, other):
+        """Whether both automata accept the same language.
+
+        ``other`` is a FiniteAutomaton of lfa1 or lfa2 or a CompiledAutomaton.
+        Returns ``(True, None)`` or ``(False, string)`` with a string only one
+        of them accepts; neither side is determinized beyond the states
+        visited before that string is found.
+        """
+        return equivalent(self.compile(), other if isinstance(other, CompiledAutomaton) else other.compile())
+
+    def includes(self, other):
+        """Whether this automaton accepts every string ``other`` accepts.
+
+        Returns ``(True, None)`` or ``(False, string)`` with a string accepted
+        by ``other`` only.
+        """
+        return includes(self.compile(), other if isinstance(other, CompiledAutomaton) else other.compile())
+
+    def write_dot(self, path, max_states=None, cluster=False, labels=True):
+        """Write the automaton to ``path`` in Graphviz DOT, without the graphviz package.
 
+        Nodes are the integer ids of the compact core; the state names go in
+        ``label`` attributes or, when ``labels`` is a path, into a
+        tab-separated id/name table written there. All edges between two
+        states are merged into one, labelled with their symbols. With
+        ``max_states`` only that many states are drawn, in breadth-first
+        order from the initial state, and edges leaving them end in one
+        "more" node; ``cluster`` groups the states by their distance from
+        the initial state. Output is written state by state, so memory stays
+        at a few bytes per state.
+        """
+        core = self.to_automaton()
+        n = len(core.states)
+        if max_states is None and not cluster:
+            order, depth = range(n), None
+        else:
+            order, depth = _breadth_first(core, n if max_states is None else max_states)
+        drawn = bytearray(n) if depth is not None else None
+        if drawn is not None:
+            for q in order:
+                drawn[q] = 1
+
+        def name(q):
+            state = core.states[q]
+            return ', '.join(state) if isinstance(state, tuple) else str(state)
+
+        with open(path, 'w', encoding='utf-8') as out:
+            table = open(labels, 'w', encoding='utf-8') if isinstance(labels, str) else None
+            try:
+                out.write('digraph FiniteAutomaton {\n  rankdir=LR;\n  node [shape=circle];\n')
+                out.write(f'  start [shape=point];\n  start -> {core.initial};\n')
+                current = None
+                for q in order:
+                    if cluster and depth[q] != current:
+                        if current is not None:
+                            out.write('  }\n')
+                        current = depth[q]
+                        out.write(f'  subgraph cluster_{current} {{\n    label="{current}";\n')
+                    attributes = []
+                    if labels is True:
+                        attributes.append(f'label="{_escape(name(q))}"')
+                    elif table is not None:
+                        table.write(f'{q}\t{name(q)}\n')
+                    if core.finals[q]:
+                        attributes.append('shape=doublecircle')
+                    indent = '    ' if cluster else '  '
+                    out.write(f'{indent}{q} [{", ".join(attributes)}];\n' if attributes else f'{indent}{q};\n')
+                if cluster and current is not None:
+                    out.write('  }\n')
+
+                more = 0
+                offsets, edge_labels, targets = core.offsets, core.labels, core.targets
+                # Edge labels by the tuple of symbol ids, bounded for large alphabets
+                texts = {}
+                for q in order:
+                    by_target = {}
+                    for i in range(offsets[q], offsets[q + 1]):
+                        p = targets[i]
+                        by_target.setdefault(p if drawn is None or drawn[p] else 'more', []).append(edge_labels[i])
+                    for p, symbols in by_target.items():
+                        if p == 'more':
+                            more += 1
+                        key = tuple(symbols)
+                        text = texts.get(key)
+                        if text is None:
+                            if len(texts) >= 4096:
+                                texts.clear()
+                            text = texts[key] = _escape(_symbols_label(
+                                ['ε' if a < 0 else str(core.symbols[a]) for a in symbols]))
+                        out.write(f'  {q} -> {p} [label="{text}"];\n')
+                if more:
+                    out.write(f'  more [shape=box, label="{n - len(order)} more states"];\n')
+                out.write('}\n')
+            finally:
+                if table is not None:
+                    table.close()
+
+    def draw_graph(self, filename='finite_automaton_graph', max_states=1000, cluster=False):
+        # Render through write_dot; graphviz is only needed for the image
+        import graphviz
+
+        self.write_dot(filename, max_states, cluster)
+        dot = graphviz.Source.from_file(filename)
         try:
-            dot.render('finite_automaton_graph', format='png', cleanup=True)
-            print("Finite automaton graph saved as finite_automaton_graph.png")
+            dot.render(filename, format='png', cleanup=True)
+            print(f"Finite automaton graph saved as {filename}.png")
         except Exception as e:
             print("Error rendering graph:", e)
 
         return dot
 
 
+def _breadth_first(core, limit):
+    # First ``limit`` states in breadth-first order from the initial one, and
+    # the distance of every state visited (-1 for the others)
+    depth = array('i', [-1]) * len(core.states)
+    depth[core.initial] = 0
+    order = array('i', [core.initial])
+    i = 0
+    while i < len(order) and len(order) < limit:
+        q = order[i]
+        i += 1
+        for j in range(core.offsets[q], core.offsets[q + 1]):
+            p = core.targets[j]
+            if depth[p] < 0:
+                depth[p] = depth[q] + 1
+                order.append(p)
+                if len(order) == limit:
+                    break
+    return order, depth
+
+
+def _symbols_label(symbols):
+    # "a-e, x" for a, b, c, d, e, x: runs of three or more consecutive
+    # characters are shown as ranges
+    symbols = sorted(set(symbols))
+    parts = []
+    i = 0
+    while i < len(symbols):
+        j = i
+        if len(symbols[i]) == 1:
+            while (j + 1 < len(symbols) and len(symbols[j + 1]) == 1
+                   and ord(symbols[j + 1]) == ord(symbols[j]) + 1):
+                j += 1
+        parts.append(f'{symbols[i]}-{symbols[j]}' if j - i >= 2 else ', '.join(symbols[i:j + 1]))
+        i = j + 1
+    return ', '.join(parts)
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('"', '\\"')
+
 def main():
     states = {'q0', 'q1', 'q2', 'q3'}
     alphabet = {'a', 'b', 'c'}
@@ -1,5 +1,7 @@
 import re
 
+from dfa_lexer import compile_lexer, tokenize_parallel
+
 # Define token types
 tokens = [
     ('DEF', r'def'),
@@ -27,6 +29,30 @@ def lexer(input_text):
             token_value = float(token_value)
         yield token_type, token_value
 
+# Tokenize with a DFA generated from the same token table: the longest match
+# wins (so "define" is one IDENTIFIER) and keywords are found by lookup
+def dfa_lexer(input_text):
+    for token_type, token_value in compile_lexer(tokens).tokenize(input_text):
+        if token_type == 'NUMBER':
+            token_value = float(token_value)
+        yield token_type, token_value
+
+# Tokenize a binary file object or mmap chunk by chunk; tokens carry byte
+# offsets and line/column, and unmatched characters come out as ERROR tokens
+def stream_lexer(source, chunk_size=1 << 16):
+    for token in compile_lexer(tokens).tokenize_stream(source, chunk_size):
+        if token.type == 'NUMBER':
+            token = token._replace(value=float(token.value))
+        yield token
+
+# Tokenize a large file on several processes; the tokens are the same as
+# stream_lexer's on the whole file
+def parallel_lexer(path, workers=None):
+    for token in tokenize_parallel(tokens, path, workers):
+        if token.type == 'NUMBER':
+            token = token._replace(value=float(token.value))
+        yield token
+
 # Example usage
 if __name__ == "__main__":
     input_text = '''
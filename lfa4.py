@@ -1,24 +1,76 @@
 import re
-import itertools
 import random
+from itertools import islice
 
-def generate_combinations(regex):
-    patterns = re.findall(r'\((.*?)\)', regex)  # Extract patterns within parentheses
-    combinations = []
-    chosen_options = []
+from automaton import CompiledAutomaton
+from lfa2 import FiniteAutomaton
+from regex_nfa import NFABuilder, leaves, parse_notation
+
+def regex_to_nfa(regex):
+    # Thompson construction over the notation's AST
+    node = parse_notation(regex)
+    for leaf in leaves(node):
+        if leaf[0] == 'set' and leaf[2]:
+            raise ValueError(f"Negated classes have no finite alphabet in {regex!r}")
+    builder = NFABuilder(lambda leaf: leaf[1])
+    start, end = builder.build(node)
+    alphabet = {symbol for (state, symbol) in builder.transitions if symbol != ''}
+    return FiniteAutomaton(set(range(builder.count)), alphabet, builder.transitions, start, {end})
 
-    while len(combinations) < 4:
-        combinations.clear()
-        chosen_options.clear()
+def compile_regex(regex):
+    dfa = regex_to_nfa(regex).minimize()
+    return CompiledAutomaton(dfa.transitions, dfa.initial_state, dfa.final_states)
 
-        for pattern in patterns:
-            options = pattern.split('|')
-            chosen_option = random.choice(options)  # Choose a random option in each group
-            chosen_options.append(chosen_option)
-            combinations.append([chosen_option])
+def language(regex, max_length=None):
+    # Every string of the language once, shortest first and alphabetically
+    # within a length; lazy, so infinite languages can be sliced with islice
+    return compile_regex(regex).strings(max_length)
 
-    valid_combinations = list(itertools.product(*combinations))
-    return [''.join(combo) for combo in valid_combinations], chosen_options
+def sample_language(regex, count, max_length, seed=None):
+    # Strings drawn uniformly from all strings of at most max_length symbols
+    compiled = compile_regex(regex)
+    counts = compiled.count_by_length(max_length)
+    total = sum(counts)
+    if not total:
+        raise ValueError(f"{regex!r} has no string of at most {max_length} symbols")
+    rng = random.Random(seed)
+    for _ in range(count):
+        r = rng.randrange(total)
+        length = 0
+        while r >= counts[length]:
+            r -= counts[length]
+            length += 1
+        yield next(compiled.sample_strings(length, 1, rng.getrandbits(64)))
+
+def generate_combinations(regex, count=4, seed=None, max_length=None):
+    # count distinct strings of the language plus the option taken in every
+    # parenthesized group, for explain_regex_processing
+    rng = random.Random(seed)
+    chosen_options = [rng.choice(pattern.split('|')) for pattern in re.findall(r'\((.*?)\)', regex)]
+    compiled = compile_regex(regex)
+    if max_length is None:
+        shortest = next(compiled.strings(), None)
+        if shortest is None:
+            return [], chosen_options
+        max_length = len(shortest) + 10
+    available = sum(compiled.count_by_length(max_length))
+    combinations = []
+    seen = set()
+    for string in sample_language(regex, 4 * count + 16, max_length, rng.getrandbits(64)):
+        if len(combinations) == min(count, available):
+            break
+        if string not in seen:
+            seen.add(string)
+            combinations.append(string)
+    if len(combinations) < min(count, available):
+        # Unlucky draws from a small language: top up in shortlex order
+        for string in compiled.strings(max_length):
+            if len(combinations) == min(count, available):
+                break
+            if string not in seen:
+                seen.add(string)
+                combinations.append(string)
+    return combinations, chosen_options
 
 def explain_regex_processing(regex, chosen_options):
     components = regex.split(' ')
@@ -41,13 +93,15 @@ def explain_regex_processing(regex, chosen_options):
 
     return explanation
 
-# Variant 1
-variant1_regex = "(a|b)(c|d)E*G? p(Q|R|S)T(uv|w|x)*Z^+ 1(0|1)*2(3|4)^5 36"
-variant1_combinations, chosen_options = generate_combinations(variant1_regex)
-variant1_processing_sequence = explain_regex_processing(variant1_regex, chosen_options)
+if __name__ == "__main__":
+    # Variant 1
+    variant1_regex = "(a|b)(c|d)E*G? p(Q|R|S)T(uv|w|x)*Z^+ 1(0|1)*2(3|4)^5 36"
+    variant1_combinations, chosen_options = generate_combinations(variant1_regex)
+    variant1_processing_sequence = explain_regex_processing(variant1_regex, chosen_options)
 
-print("Variant 1:")
-print("Generated Combinations:", variant1_combinations)
-print("Processing Sequence:")
-for step, explanation in enumerate(variant1_processing_sequence, 1):
-    print(f"Step {step}: {explanation}")
+    print("Variant 1:")
+    print("Generated Combinations:", variant1_combinations)
+    print("Shortest strings:", list(islice(language(variant1_regex), 4)))
+    print("Processing Sequence:")
+    for step, explanation in enumerate(variant1_processing_sequence, 1):
+        print(f"Step {step}: {explanation}")
@@ -1,9 +1,92 @@
+from collections import deque
+
+
+def symbols_of(rhs, nonterminals=()):
+    # Right-hand sides are strings of one-character symbols, unless they
+    # separate their symbols with spaces ("N1 a N2") or are a single
+    # nonterminal with a longer name
+    if ' ' in rhs:
+        return tuple(rhs.split())
+    if rhs in nonterminals:
+        return (rhs,)
+    return tuple(rhs)
+
+
+def join_symbols(symbols, nonterminals=()):
+    # The inverse of symbols_of
+    text = ''.join(symbols)
+    if len(symbols) == 1 or (len(text) == len(symbols) and text not in nonterminals):
+        return text
+    return ' '.join(symbols)
+
+
+def occurrence_index(rules):
+    # symbol -> [(lhs, production)] for every production it occurs in
+    index = {}
+    for A, productions in rules.items():
+        for production in productions:
+            for symbol in set(production):
+                index.setdefault(symbol, []).append((A, production))
+    return index
+
+
+def _closure(rules, index, candidate):
+    # Worklist fixed point: A is added once one of its candidate
+    # productions has all of its nonterminals added
+    found = set()
+    missing = {}
+    worklist = deque()
+    for A, productions in rules.items():
+        for production in productions:
+            if candidate(production):
+                count = missing[(A, production)] = sum(1 for symbol in production if symbol in rules)
+                if count == 0 and A not in found:
+                    found.add(A)
+                    worklist.append(A)
+    while worklist:
+        B = worklist.popleft()
+        for A, production in index.get(B, ()):
+            key = (A, production)
+            if key in missing:
+                missing[key] -= production.count(B)
+                if missing[key] == 0 and A not in found:
+                    found.add(A)
+                    worklist.append(A)
+    return found
+
+
+def productive_symbols(rules, index=None):
+    """Nonterminals that derive at least one terminal string."""
+    index = occurrence_index(rules) if index is None else index
+    return _closure(rules, index, lambda production: True)
+
+
+def nullable_symbols(rules, index=None):
+    """Nonterminals that derive the empty string."""
+    index = occurrence_index(rules) if index is None else index
+    return _closure(rules, index, lambda production: all(symbol in rules for symbol in production))
+
+
+def reachable_symbols(rules, start):
+    """Nonterminals reachable from ``start``."""
+    reachable = {start}
+    queue = deque([start])
+    while queue:
+        for production in rules.get(queue.popleft(), ()):
+            for symbol in production:
+                if symbol in rules and symbol not in reachable:
+                    reachable.add(symbol)
+                    queue.append(symbol)
+    return reachable
+
+
 class Grammar:
     def __init__(self):
-        self.VN = set()  
-        self.VT = set()  
-        self.P = {}      
-        self.S = ''      
+        self.VN = set()
+        self.VT = set()
+        self.P = {}
+        self.S = ''
+        self._analysis = None
 
     def add_production(self, production):
         parts = production.split('->')
@@ -13,79 +96,148 @@ class Grammar:
             self.S = lhs
         self.VN.add(lhs)
         for symbol in rhs:
-            self.VT.update(set(symbol.split()) - self.VN)
+            self.VT.update(set(symbols_of(symbol, self.VN)) - self.VN)
+        old = self.P.get(lhs)
         self.P[lhs] = rhs
+        if self._analysis is not None:
+            self._analysis.update(lhs, old, rhs)
+
+    def analysis(self):
+        """The GrammarAnalysis of this grammar, kept up to date by add_production."""
+        if self._analysis is None:
+            self._analysis = GrammarAnalysis(self)
+        return self._analysis
+
+    def rules(self):
+        # Productions as {lhs: set of symbol tuples}, duplicates merged
+        nonterminals = set(self.P)
+        return {A: {symbols_of(rhs, nonterminals) for rhs in productions} for A, productions in self.P.items()}
+
+    def set_rules(self, rules):
+        if self.S and self.S not in rules:
+            rules[self.S] = set()
+        self.P = {A: sorted(join_symbols(production, rules) for production in productions)
+                  for A, productions in rules.items()}
+        self.VN = set(rules)
+        self.VT = {symbol for productions in rules.values() for production in productions
+                   for symbol in production if symbol not in rules}
+        if self._analysis is not None:
+            self._analysis.invalidate()
 
     def remove_epsilon(self):
         # Step 1: Eliminate ε-productions
-        epsilon_productions = {key for key, value in self.P.items() if '' in value}
-        while epsilon_productions:
-            for A in epsilon_productions:
-                self.P[A].remove('')
-                for key, value in self.P.items():
-                    for prod in value[:]:
-                        if A in prod:
-                            self.P[key].extend([x.replace(A, '') for x in value if x])
-            epsilon_productions = {key for key, value in self.P.items() if '' in value}
+        self.set_rules(_remove_epsilon(self.rules(), self.S))
 
     def remove_unit(self):
         # Step 2: Eliminate unit productions
-        unit_productions = {key: value for key, value in self.P.items() if len(value) == 1 and value[0] in self.VN}
-        while unit_productions:
-            for A, B in unit_productions.items():
-                self.P[A].remove(B[0])
-                self.P[A].extend(self.P[B[0]])
-                self.P[A] = list(set(self.P[A]))
-            unit_productions = {key: value for key, value in self.P.items() if len(value) == 1 and value[0] in self.VN}
+        self.set_rules(_remove_unit(self.rules()))
 
     def remove_inaccessible(self):
         # Step 3: Eliminate inaccessible symbols
-        reachable = set()
-        reachable.add(self.S)
-        old_size = 0
-        while len(reachable) != old_size:
-            old_size = len(reachable)
-            for A, prods in self.P.items():
-                if any(sym in reachable for sym in prods):
-                    reachable.add(A)
-        unreachable = set(self.VN) - reachable
-        for A in unreachable:
-            self.VN.remove(A)
-            del self.P[A]
+        rules = self.rules()
+        reachable = reachable_symbols(rules, self.S)
+        self.set_rules({A: productions for A, productions in rules.items() if A in reachable})
 
     def remove_non_productive(self):
         # Step 4: Eliminate non-productive symbols
-        productive = set(self.VT)
-        old_size = 0
-        while len(productive) != old_size:
-            old_size = len(productive)
-            for A, prods in self.P.items():
-                if all(sym in productive or sym == '' for sym in prods):
-                    productive.add(A)
-        non_productive = set(self.VN) - productive
-        for A in non_productive:
-            self.VN.remove(A)
-            del self.P[A]
+        self.set_rules(_remove_non_productive(self.rules()))
 
     def convert_to_cnf(self):
-        self.remove_epsilon()
-        self.remove_unit()
-        self.remove_inaccessible()
-        self.remove_non_productive()
-        # Step 5: Convert productions into CNF
-        for A, prods in self.P.items():
-            for prod in prods[:]:
-                if len(prod) > 2:
-                    new_prods = [prod[:2]]
-                    for symbol in prod[2:]:
-                        new_non_terminal = symbol
-                        while new_non_terminal in self.VN:
-                            new_non_terminal += "'"
-                        self.VN.add(new_non_terminal)
-                        self.P[new_non_terminal] = [symbol]
-                        new_prods.append(new_non_terminal)
-                    self.P[A].remove(prod)
-                    self.P[A].extend(new_prods)
+        """Convert the grammar to Chomsky normal form in place.
+
+        The steps work on indexed sets of symbol tuples: a new start symbol
+        if S occurs on a right-hand side, removal of useless symbols,
+        terminals replaced by nonterminals in long productions, binarization,
+        ε-removal (only the start symbol keeps an empty production),
+        unit-pair closure, then useless symbols again. Each step is
+        near-linear in the grammar size.
+        """
+        rules = self.rules()
+        used = set(rules) | {symbol for productions in rules.values() for p in productions for symbol in p}
+        counters = {}
+
+        def fresh(base):
+            count = counters.get(base, 0)
+            while True:
+                count += 1
+                name = f'{base}{count}'
+                if name not in used:
+                    counters[base] = count
+                    used.add(name)
+                    return name
+
+        start = self.S
+        if any(start in production for productions in rules.values() for production in productions):
+            start = fresh(start)
+            rules[start] = {(self.S,)}
+
+        rules = _remove_non_productive(rules)
+        rules.setdefault(start, set())
+        reachable = reachable_symbols(rules, start)
+        rules = {A: productions for A, productions in rules.items() if A in reachable}
+
+        # Terminals inside productions of two or more symbols get their own
+        # nonterminal
+        terminal_names = {}
+        for A in list(rules):
+            replaced = set()
+            for production in rules[A]:
+                if len(production) > 1:
+                    production = tuple(self._terminal(symbol, rules, terminal_names, fresh)
+                                       if symbol not in rules else symbol for symbol in production)
+                replaced.add(production)
+            rules[A] = replaced
+
+        # Split long productions into chains of pairs
+        for A in list(rules):
+            binary = set()
+            for production in rules[A]:
+                lhs = A
+                while len(production) > 2:
+                    rest = fresh(A)
+                    if lhs == A:
+                        binary.add((production[0], rest))
+                    else:
+                        rules[lhs] = {(production[0], rest)}
+                    lhs, production = rest, production[1:]
+                if lhs == A:
+                    binary.add(production)
+                else:
+                    rules[lhs] = {production}
+            rules[A] = binary
+
+        rules = _remove_epsilon(rules, start)
+        rules = _remove_unit(rules)
+        # Nonterminals that only had ε left nothing behind, so drop them and
+        # every production that uses them
+        rules = _remove_non_productive(rules)
+        rules.setdefault(start, set())
+        reachable = reachable_symbols(rules, start)
+        rules = {A: productions for A, productions in rules.items() if A in reachable}
+        self.S = start
+        self.set_rules(rules)
+
+    @staticmethod
+    def _terminal(symbol, rules, terminal_names, fresh):
+        name = terminal_names.get(symbol)
+        if name is None:
+            name = terminal_names[symbol] = fresh('X')
+            rules[name] = {(symbol,)}
+        return name
+
+    def copy(self):
+        grammar = Grammar()
+        grammar.VN = set(self.VN)
+        grammar.VT = set(self.VT)
+        grammar.P = {A: list(productions) for A, productions in self.P.items()}
+        grammar.S = self.S
+        return grammar
+
+    def recognizer(self):
+        """A CYKRecognizer for the language of this grammar (converted to CNF on a copy)."""
+        cnf = self.copy()
+        cnf.convert_to_cnf()
+        return CYKRecognizer(cnf)
 
     def print_grammar(self):
         print("VN:", self.VN)
@@ -96,20 +248,455 @@ class Grammar:
                 print(key, "->", prod)
         print("S:", self.S)
 
-# Define the grammar string
-grammar_str = """
-S -> aB | bA
-A -> B | b | aD | AS | bAAB | 
-B -> b | bS
-C -> AB
-D -> BB
-"""
-grammar = Grammar()
 
-productions = grammar_str.strip().split('\n')
-for prod in productions:
-    grammar.add_production(prod)
+def _remove_non_productive(rules):
+    productive = productive_symbols(rules)
+    return {A: {production for production in productions
+                if all(symbol in productive or symbol not in rules for symbol in production)}
+            for A, productions in rules.items() if A in productive}
+
+
+def _remove_epsilon(rules, start):
+    # Every production gets a variant for each subset of its nullable
+    # symbols left out; empty productions remain only for the start symbol
+    nullable = nullable_symbols(rules)
+    result = {}
+    for A, productions in rules.items():
+        variants = set()
+        for production in productions:
+            options = [()]
+            for symbol in production:
+                if symbol in nullable:
+                    options = [option + (symbol,) for option in options] + options
+                else:
+                    options = [option + (symbol,) for option in options]
+            variants.update(option for option in options if option)
+        if A == start and A in nullable:
+            variants.add(())
+        result[A] = variants
+    return result
+
+
+def _remove_unit(rules):
+    # A gets the non-unit productions of every B with A =>* B by unit steps
+    units = {A: {production[0] for production in productions if len(production) == 1 and production[0] in rules}
+             for A, productions in rules.items()}
+    result = {}
+    for A in rules:
+        seen = {A}
+        stack = [A]
+        while stack:
+            for B in units[stack.pop()]:
+                if B not in seen:
+                    seen.add(B)
+                    stack.append(B)
+        result[A] = {production for B in seen for production in rules[B]
+                     if not (len(production) == 1 and production[0] in rules)}
+    return result
+
+
+class GrammarAnalysis:
+    """Nullable, FIRST, FOLLOW, reachable and productive sets and the
+    Chomsky type of a Grammar, updated as productions are added.
+
+    Adding productions only ever grows these sets, so add_production
+    propagates the new facts with worklists from the changed rule. Changes
+    that can shrink them (replacing a rule with one that drops productions,
+    or defining a symbol that was used as a terminal when it turns out
+    non-productive) mark the analysis stale, and the next query rebuilds
+    it. FIRST and FOLLOW are kept as sets of symbols closed under
+    inclusion edges (FIRST(B) ⊆ FIRST(A) for A -> B...), and terminals are
+    picked out when queried, so they do not depend on which symbols are
+    nonterminals yet. Edits made to ``P`` directly need invalidate().
+    """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.stale = True
+        self.productive_stale = False
+
+    def invalidate(self):
+        self.stale = True
+
+    def rebuild(self):
+        grammar = self.grammar
+        self.start = grammar.S
+        self.rules = {A: set() for A in grammar.P}
+        self.index = {}  # symbol -> {(lhs, production)}
+        self.multi_char = set()  # right-hand sides read as characters that a new nonterminal could rename
+        self.nullable = set()
+        self.productive = set()
+        self.reached = {grammar.S}  # symbols reachable from S, terminals included
+        self.missing_nullable = {}  # (lhs, production) -> symbols not yet known nullable
+        self.missing_productive = {}  # (lhs, production) -> nonterminals not yet known productive
+        self.witness = {}  # productive nonterminal -> the production that first showed it
+        self.sets = {}  # ('first', X) or ('follow', X) -> symbols
+        self.edges = {}  # node -> nodes whose set includes its set
+        self.linked = set()
+        self.kinds = {}  # (lhs, production) -> Chomsky type flags
+        self.counts = [0, 0, 0, 0]
+        self.stale = self.productive_stale = False
+        self.seed(('follow', grammar.S), {'$'})
+        for A, productions in grammar.P.items():
+            for rhs in productions:
+                self.add(A, rhs)
+
+    def update(self, lhs, old, new):
+        if self.stale:
+            return
+        if self.grammar.S != self.start or (len(lhs) > 1 and lhs in self.multi_char):
+            self.stale = True
+            return
+        defined = lhs not in self.rules
+        if defined:
+            self.rules[lhs] = set()
+            # lhs was read as a terminal so far
+            for A, production in list(self.index.get(lhs, ())):
+                self.count(A, production)
+                self.classify(A, production)
+        productions = {symbols_of(rhs, self.rules) for rhs in old or ()}
+        if productions - {symbols_of(rhs, self.rules) for rhs in new}:
+            self.stale = True
+            return
+        for rhs in new:
+            self.add(lhs, rhs)
+        if defined:
+            if lhs in self.reached:
+                self.reach(lhs)
+            if lhs in self.index and not self.proven(lhs):
+                self.productive_stale = True
+
+    def add(self, A, rhs):
+        production = symbols_of(rhs, self.rules)
+        if ' ' not in rhs and len(rhs) > 1:
+            self.multi_char.add(rhs)
+        if production in self.rules[A]:
+            return
+        self.rules[A].add(production)
+        for symbol in set(production):
+            self.index.setdefault(symbol, set()).add((A, production))
+        self.classify(A, production)
+        self.count(A, production)
+        self.link(A, production)
+        if A in self.reached:
+            self.reach(*production)
+
+    def count(self, A, production, nullable=True):
+        # (Re)start the nullable and productive counters of a production
+        rules = self.rules
+        key = (A, production)
+        if nullable and all(symbol in rules for symbol in production):
+            missing = self.missing_nullable[key] = sum(1 for symbol in production if symbol not in self.nullable)
+            if missing == 0:
+                self.mark(A, self.nullable, self.missing_nullable)
+        missing = self.missing_productive[key] = sum(
+            1 for symbol in production if symbol in rules and symbol not in self.productive)
+        if missing == 0:
+            self.mark(A, self.productive, self.missing_productive, production)
+
+    def proven(self, symbol):
+        # Whether a newly defined symbol, used as a terminal until now, is
+        # productive without relying on having been a terminal: some
+        # production of it only needs symbols whose witnesses avoid it
+        def avoids(start):
+            stack, seen = [start], {start}
+            while stack:
+                for X in self.witness[stack.pop()]:
+                    if X == symbol:
+                        return False
+                    if X in self.rules and X not in seen:
+                        seen.add(X)
+                        stack.append(X)
+            return True
+
+        for production in self.rules[symbol]:
+            if all(X not in self.rules or (X != symbol and X in self.productive and avoids(X))
+                   for X in production):
+                self.productive.add(symbol)
+                self.witness[symbol] = production
+                return True
+        return False
+
+    def mark(self, symbol, found, missing, production=None):
+        worklist = [symbol]
+        if symbol in found:
+            return
+        found.add(symbol)
+        if found is self.productive:
+            self.witness[symbol] = production
+        while worklist:
+            B = worklist.pop()
+            for A, production in list(self.index.get(B, ())):
+                if found is self.nullable:
+                    # Symbols after B can now start or follow more
+                    self.link(A, production)
+                key = (A, production)
+                if key not in missing:
+                    continue
+                missing[key] -= production.count(B)
+                if missing[key] == 0 and A not in found:
+                    found.add(A)
+                    if found is self.productive:
+                        self.witness[A] = production
+                    worklist.append(A)
+
+    def link(self, A, production):
+        # FIRST(A) gets each leading symbol up to the first non-nullable
+        # one; FOLLOW(B) gets what can come after B, and FOLLOW(A) when
+        # everything after B is nullable
+        nullable = self.nullable
+        for Y in production:
+            self.include(('first', Y), ('first', A), Y)
+            if Y not in nullable:
+                break
+        for i, B in enumerate(production):
+            for y in production[i + 1:]:
+                self.include(('first', y), ('follow', B), y)
+                if y not in nullable:
+                    break
+            else:
+                self.include(('follow', A), ('follow', B))
+
+    def include(self, source, target, symbol=None):
+        # From now on set(source) | {symbol} is part of set(target)
+        if (source, target, symbol) in self.linked:
+            return
+        self.linked.add((source, target, symbol))
+        if symbol is not None:
+            self.seed(target, {symbol})
+        if target not in self.edges.setdefault(source, set()):
+            self.edges[source].add(target)
+            self.seed(target, self.sets.get(source, ()))
+
+    def seed(self, node, symbols):
+        worklist = [(node, set(symbols))]
+        sets, edges = self.sets, self.edges
+        while worklist:
+            node, symbols = worklist.pop()
+            current = sets.setdefault(node, set())
+            new = symbols - current
+            if new:
+                current |= new
+                worklist.extend((target, new) for target in edges.get(node, ()))
+
+    def reach(self, *symbols):
+        stack = list(symbols)
+        for symbol in symbols:
+            self.reached.add(symbol)
+        while stack:
+            for production in self.rules.get(stack.pop(), ()):
+                for symbol in production:
+                    if symbol not in self.reached:
+                        self.reached.add(symbol)
+                        stack.append(symbol)
+
+    def classify(self, A, production):
+        # Flags: not right-linear, not left-linear, not context-free, contracting
+        key = (A, production)
+        old = self.kinds.get(key)
+        rules = self.rules
+        positions = [i for i, symbol in enumerate(production) if symbol in rules]
+        lhs = A.split()
+        flags = (
+            bool(positions) and positions != [len(production) - 1],
+            bool(positions) and positions != [0],
+            len(lhs) != 1,
+            len(production) < len(lhs) or (not production and A != self.start),
+        )
+        if old is not None:
+            for i, flag in enumerate(old):
+                self.counts[i] -= flag
+        for i, flag in enumerate(flags):
+            self.counts[i] += flag
+        self.kinds[key] = flags
+
+    def fresh(self):
+        if self.stale:
+            self.rebuild()
+        elif self.productive_stale:
+            self.productive = set()
+            self.witness = {}
+            self.missing_productive = {}
+            for A, productions in self.rules.items():
+                for production in productions:
+                    self.count(A, production, nullable=False)
+            self.productive_stale = False
+        return self
+
+    def nullable_symbols(self):
+        return set(self.fresh().nullable)
+
+    def productive_symbols(self):
+        return set(self.fresh().productive)
+
+    def reachable_symbols(self):
+        self.fresh()
+        return {symbol for symbol in self.reached if symbol in self.rules}
+
+    def first(self, symbol):
+        """Terminals that can start a string derived from ``symbol`` ('' if it is nullable)."""
+        self.fresh()
+        if symbol not in self.rules:
+            return {symbol}
+        first = {y for y in self.sets.get(('first', symbol), ()) if y not in self.rules}
+        return first | {''} if symbol in self.nullable else first
+
+    def follow(self, symbol):
+        """Terminals that can come right after ``symbol`` ('$' for the end of input)."""
+        self.fresh()
+        return {y for y in self.sets.get(('follow', symbol), ()) if y not in self.rules}
+
+    def chomsky_type(self):
+        """3 (regular), 2 (context-free), 1 (context-sensitive) or 0."""
+        not_right, not_left, not_context_free, contracting = self.fresh().counts
+        if not not_context_free and (not not_right or not not_left):
+            return 3
+        if not not_context_free:
+            return 2
+        return 1 if not contracting else 0
+
+
+class CYKRecognizer:
+    """CYK membership test for a grammar in Chomsky normal form.
+
+    Every cell of the table is an int bitset of nonterminals. For each
+    left symbol B, binary productions are kept as a table from the bits
+    of a right cell that B pairs with to the bitset of heads A -> B C, so
+    combining two cells is one OR per bit of the left cell, and the
+    result for a (left cell, right cell) pair is memoized.
+
+    A grammar yields few distinct cells, so each row of the table is kept
+    as a bitset of end positions per distinct cell. The rows are filled
+    from the last start position to the first: every non-empty cell is
+    visited once, in order of its end, and combined with each distinct
+    cell of the row where it ends, reaching all of their end positions
+    with one OR instead of one per split point.
+    """
+
+    def __init__(self, grammar, max_memo=1 << 20):
+        rules = grammar.rules()
+        ids = {A: i for i, A in enumerate(sorted(rules))}
+        self.start = 1 << ids[grammar.S]
+        self.accepts_empty = () in rules[grammar.S]
+        self.terminals = {}  # terminal -> bitset of A with A -> terminal
+        self.by_left = {}  # B -> {bitset of C: bitset of A with A -> B C}
+        self.right_of = {}  # B -> bitset of C with some A -> B C
+        for A, productions in rules.items():
+            for production in productions:
+                if len(production) == 1:
+                    self.terminals[production[0]] = self.terminals.get(production[0], 0) | 1 << ids[A]
+                elif len(production) == 2:
+                    B, C = ids[production[0]], 1 << ids[production[1]]
+                    table = self.by_left.setdefault(B, {})
+                    table[C] = table.get(C, 0) | 1 << ids[A]
+                    self.right_of[B] = self.right_of.get(B, 0) | C
+        self.left_mask = sum(1 << B for B in self.by_left)
+        # Terminals that can begin and end a string of each nonterminal; a
+        # string with a pair of neighbours no production can put side by
+        # side is rejected before the table is filled
+        first = {A: {p[0] for p in productions if len(p) == 1} for A, productions in rules.items()}
+        last = {A: set(terminals) for A, terminals in first.items()}
+        binary = [(A, p[0], p[1]) for A, productions in rules.items() for p in productions if len(p) == 2]
+        changed = True
+        while changed:
+            changed = False
+            for A, B, C in binary:
+                if not first[B] <= first[A] or not last[C] <= last[A]:
+                    first[A] |= first[B]
+                    last[A] |= last[C]
+                    changed = True
+        self.first, self.last = first[grammar.S], last[grammar.S]
+        self.neighbours = {(x, y) for A, B, C in binary for x in last[B] for y in first[C]}
+        self.memo = {}
+        self.max_memo = max_memo
+
+    def combine(self, left, right):
+        # Bitset of A with A -> B C for some B in left and C in right
+        key = (left, right)
+        result = self.memo.get(key)
+        if result is None:
+            result = 0
+            left &= self.left_mask
+            while left:
+                low = left & -left
+                left ^= low
+                B = low.bit_length() - 1
+                pairs = right & self.right_of[B]
+                if pairs:
+                    table = self.by_left[B]
+                    heads = table.get(pairs)
+                    if heads is None:
+                        # A new set of right symbols: the union of its single bits
+                        heads, rest = 0, pairs
+                        while rest:
+                            bit = rest & -rest
+                            rest ^= bit
+                            heads |= table[bit]
+                        table[pairs] = heads
+                    result |= heads
+            if len(self.memo) >= self.max_memo:
+                self.memo.clear()
+            self.memo[key] = result
+        return result
+
+    def accepts(self, string):
+        """Whether the grammar generates ``string`` (a str, or a sequence of terminals)."""
+        n = len(string)
+        if n == 0:
+            return self.accepts_empty
+        terminals, combine, memo = self.terminals, self.combine, self.memo
+        leaves = [terminals.get(symbol, 0) for symbol in string]
+        if not all(leaves) or string[0] not in self.first or string[-1] not in self.last:
+            return False
+        if not self.neighbours.issuperset(zip(string, string[1:])):
+            return False
+        rows = [None] * n + [{}]  # rows[k]: {cell: bitset of j with cells[k][j] == cell}
+        for i in range(n - 1, -1, -1):
+            reached = {leaves[i]: 1 << (i + 1)}  # part of a cell in row i -> where it ends
+            row = {}
+            pending = 1 << (i + 1)
+            while pending:
+                end_bit = pending & -pending
+                pending ^= end_bit
+                k = end_bit.bit_length() - 1
+                # Everything that reaches k came from a shorter cell of this row
+                cell = 0
+                for part, ends in reached.items():
+                    if ends & end_bit:
+                        cell |= part
+                row[cell] = row.get(cell, 0) | end_bit
+                for right, ends in rows[k].items():
+                    part = memo.get((cell, right))
+                    if part is None:
+                        part = combine(cell, right)
+                    if part:
+                        reached[part] = reached.get(part, 0) | ends
+                        pending |= ends
+            rows[i] = row
+        return any(cell & self.start for cell, ends in rows[0].items() if ends >> n & 1)
+
+    def accepts_many(self, strings):
+        """accepts() for every string; repeated strings are tested once."""
+        results = {}
+        return [results[string] if string in results else results.setdefault(string, self.accepts(string))
+                for string in strings]
+
+
+if __name__ == "__main__":
+    # Define the grammar string
+    grammar_str = """
+    S -> aB | bA
+    A -> B | b | aD | AS | bAAB |
+    B -> b | bS
+    C -> AB
+    D -> BB
+    """
+    grammar = Grammar()
+
+    productions = grammar_str.strip().split('\n')
+    for prod in productions:
+        grammar.add_production(prod)
 
-grammar.convert_to_cnf()
+    grammar.convert_to_cnf()
 
-grammar.print_grammar()
+    grammar.print_grammar()
@@ -0,0 +1,276 @@
+"""Regular expression front end shared by the lexer generator and lfa4.
+
+Patterns are parsed into small tuple ASTs:
+
+    ('set', chars, negated)     one character from chars (or not from it)
+    ('concat', [nodes])
+    ('alt', [nodes])
+    ('repeat', node, low, high) high is None for no upper bound
+
+and compiled to an epsilon-NFA with Thompson's construction.
+"""
+
+DIGITS = frozenset('0123456789')
+WORD = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+SPACE = frozenset(' \t\n\r\f\v')
+ESCAPES = {
+    'd': (DIGITS, False), 'D': (DIGITS, True),
+    'w': (WORD, False), 'W': (WORD, True),
+    's': (SPACE, False), 'S': (SPACE, True),
+    'n': (frozenset('\n'), False), 't': (frozenset('\t'), False), 'r': (frozenset('\r'), False),
+}
+EMPTY = ('concat', [])
+
+
+def parse_pattern(pattern):
+    """Parse the subset of Python ``re`` syntax used by token tables.
+
+    Supports literals, escapes, ``.``, character classes with ranges and
+    negation, groups (``(...)`` and ``(?:...)``), ``|`` and the ``* + ?
+    {m} {m,n}`` quantifiers. Anchors, backreferences and lookaround are
+    rejected.
+    """
+    parser = _PatternParser(pattern)
+    node = parser.alternation()
+    if parser.pos != len(pattern):
+        raise ValueError(f"Unexpected {pattern[parser.pos]!r} at {parser.pos} in {pattern!r}")
+    return node
+
+
+def parse_notation(pattern):
+    """Parse the regular expressions of lfa4's variants.
+
+    Same as parse_pattern, except that spaces are ignored, ``X^n`` repeats
+    X exactly n times and ``X^+`` means one or more X, as in
+    ``(a|b)(c|d)E*G? p(Q|R|S)T(uv|w|x)*Z^+ 1(0|1)*2(3|4)^5 36``.
+    """
+    parser = _NotationParser(pattern)
+    node = parser.alternation()
+    if parser.peek() is not None:
+        raise ValueError(f"Unexpected {pattern[parser.pos]!r} at {parser.pos} in {pattern!r}")
+    return node
+
+
+class _PatternParser:
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+
+    def peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def take(self):
+        char = self.pattern[self.pos]
+        self.pos += 1
+        return char
+
+    def alternation(self):
+        options = [self.concatenation()]
+        while self.peek() == '|':
+            self.take()
+            options.append(self.concatenation())
+        return options[0] if len(options) == 1 else ('alt', options)
+
+    def concatenation(self):
+        items = []
+        while self.peek() not in (None, '|', ')'):
+            items.append(self.quantified())
+        return items[0] if len(items) == 1 else ('concat', items)
+
+    def quantified(self):
+        node = self.atom()
+        while True:
+            repeated = self.quantifier(node)
+            if repeated is None:
+                return node
+            node = repeated
+
+    def quantifier(self, node):
+        # node with the quantifier at the current position applied, or None
+        char = self.peek()
+        if char == '*':
+            self.take()
+            return ('repeat', node, 0, None)
+        if char == '+':
+            self.take()
+            return ('repeat', node, 1, None)
+        if char == '?':
+            self.take()
+            return ('repeat', node, 0, 1)
+        if char == '{' and self._is_counted():
+            low, high = self._counted()
+            return ('repeat', node, low, high)
+        return None
+
+    def _is_counted(self):
+        end = self.pattern.find('}', self.pos)
+        body = self.pattern[self.pos + 1:end] if end > 0 else ''
+        return bool(body) and all(part.isdigit() or part == '' for part in body.split(',', 1)) and body[0].isdigit()
+
+    def _counted(self):
+        end = self.pattern.index('}', self.pos)
+        body = self.pattern[self.pos + 1:end]
+        self.pos = end + 1
+        if ',' not in body:
+            return int(body), int(body)
+        low, high = body.split(',', 1)
+        return int(low), int(high) if high else None
+
+    def atom(self):
+        char = self.take()
+        if char == '(':
+            if self.pattern.startswith('?:', self.pos):
+                self.pos += 2
+            elif self.peek() == '?':
+                raise ValueError(f"Unsupported group at {self.pos} in {self.pattern!r}")
+            node = self.alternation()
+            if self.peek() != ')':
+                raise ValueError(f"Missing ')' in {self.pattern!r}")
+            self.take()
+            return node
+        if char == '[':
+            return self.char_class()
+        if char == '.':
+            return ('set', frozenset('\n'), True)
+        if char == '\\':
+            return self.escape()
+        if char in '^$*+?{)':
+            raise ValueError(f"Unsupported {char!r} at {self.pos - 1} in {self.pattern!r}")
+        return ('set', frozenset(char), False)
+
+    def escape(self):
+        char = self.take()
+        if char in ESCAPES:
+            chars, negated = ESCAPES[char]
+            return ('set', chars, negated)
+        if char.isalnum():
+            raise ValueError(f"Unsupported escape \\{char} in {self.pattern!r}")
+        return ('set', frozenset(char), False)
+
+    def char_class(self):
+        negated = self.peek() == '^'
+        if negated:
+            self.take()
+        chars = set()
+        first = True
+        while True:
+            char = self.take()
+            if char == ']' and not first:
+                break
+            first = False
+            if char == '\\':
+                escaped = self.take()
+                if escaped in ESCAPES:
+                    escape_chars, escape_negated = ESCAPES[escaped]
+                    if escape_negated:
+                        raise ValueError(f"Unsupported \\{escaped} inside [] in {self.pattern!r}")
+                    chars |= escape_chars
+                    continue
+                char = escaped
+            if self.peek() == '-' and self.pattern[self.pos + 1:self.pos + 2] not in ('', ']'):
+                self.take()
+                end = self.take()
+                if end == '\\':
+                    end = self.take()
+                chars.update(chr(c) for c in range(ord(char), ord(end) + 1))
+            else:
+                chars.add(char)
+        return ('set', frozenset(chars), negated)
+
+
+class _NotationParser(_PatternParser):
+    def peek(self):
+        # Spaces only separate parts, so "^5 36" is five repeats, then 36
+        while self.pos < len(self.pattern) and self.pattern[self.pos].isspace():
+            self.pos += 1
+        return super().peek()
+
+    def quantifier(self, node):
+        if self.peek() != '^':
+            return super().quantifier(node)
+        self.take()
+        if self.peek() == '+':
+            self.take()
+            return ('repeat', node, 1, None)
+        start = self.pos
+        while self.pos < len(self.pattern) and self.pattern[self.pos].isdigit():
+            self.pos += 1
+        if start == self.pos:
+            raise ValueError(f"Expected '+' or a count after '^' at {start} in {self.pattern!r}")
+        count = int(self.pattern[start:self.pos])
+        return ('repeat', node, count, count)
+
+
+def leaves(node):
+    """All ('set', ...) leaves of an AST."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node[0] == 'set':
+            yield node
+        elif node[0] in ('concat', 'alt'):
+            stack.extend(node[1])
+        else:
+            stack.append(node[1])
+
+
+class NFABuilder:
+    """Thompson construction into a ``{(state, symbol): targets}`` dict.
+
+    States are ints. ``symbols_of`` maps a ('set', ...) leaf to the
+    automaton symbols it stands for.
+    """
+
+    def __init__(self, symbols_of):
+        self.symbols_of = symbols_of
+        self.transitions = {}
+        self.count = 0
+
+    def new_state(self):
+        self.count += 1
+        return self.count - 1
+
+    def add(self, state, symbol, next_state):
+        self.transitions.setdefault((state, symbol), set()).add(next_state)
+
+    def build(self, node):
+        """Add a fragment for ``node``; returns its (start, end) states."""
+        start = self.new_state()
+        end = self.new_state()
+        kind = node[0]
+        if kind == 'set':
+            for symbol in self.symbols_of(node):
+                self.add(start, symbol, end)
+        elif kind == 'concat':
+            current = start
+            for item in node[1]:
+                item_start, item_end = self.build(item)
+                self.add(current, '', item_start)
+                current = item_end
+            self.add(current, '', end)
+        elif kind == 'alt':
+            for option in node[1]:
+                option_start, option_end = self.build(option)
+                self.add(start, '', option_start)
+                self.add(option_end, '', end)
+        else:
+            _, item, low, high = node
+            current = start
+            for _ in range(low):
+                item_start, item_end = self.build(item)
+                self.add(current, '', item_start)
+                current = item_end
+            if high is None:
+                item_start, item_end = self.build(item)
+                self.add(current, '', item_start)
+                self.add(item_end, '', item_start)
+                self.add(item_end, '', end)
+                self.add(current, '', end)
+            else:
+                for _ in range(high - low):
+                    item_start, item_end = self.build(item)
+                    self.add(current, '', item_start)
+                    self.add(current, '', end)
+                    current = item_end
+                self.add(current, '', end)
+        return start, end